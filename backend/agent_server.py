@@ -1,10 +1,21 @@
+import json
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 # Import your main agent logic
-from main import main
+from main import main, main_stream
+from notion.search import aclose_pools, ollama_pool_stats, query_cache, answer_cache
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Ollama keep-alive connections belong to this loop; close them on it.
+    await aclose_pools()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 class Query(BaseModel):
     text: str
@@ -23,6 +34,33 @@ async def run_agent(q: Query):
             "error": str(e)
         }
 
+@app.post("/query/stream")
+async def stream_agent(q: Query):
+    """
+    Server-sent events: `sources` and `token` events while a Notion answer
+    is generated, then `done` with the full response (or `error`).
+    """
+    async def events():
+        try:
+            async for event in main_stream(q.text):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/stats")
+async def stats():
+    return {
+        "ollama": ollama_pool_stats(),
+        "query_embeddings": query_cache.stats(),
+        "answers": answer_cache.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("agent_server:app", host="127.0.0.1", port=8000, reload=False)
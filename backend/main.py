@@ -37,7 +37,7 @@ TOOL_REGISTRY.update(FACETIME_TOOLS)
 
 # Notion Agent utilities
 from notion import *
-from notion.search import run_search, fetch_notion_content
+from notion.search import run_search, run_search_stream, fetch_notion_content
 
 litellm.disable_streaming_logging = True 
 
@@ -600,14 +600,15 @@ async def run_mac_tool_from_query(query: str) -> str:
 
 
 # ---------- Routing Logic ----------
-async def main(query: str) -> str:
+async def main(query: str, routing_result=None) -> str:
     """
     Main entrypoint for ALL queries.
     Returns a string response suitable for UI / HTTP response.
     """
 
-    # 1. Ask router which agent should handle this
-    routing_result = await Runner.run(routerAgent, query)
+    # 1. Ask router which agent should handle this (unless main_stream did)
+    if routing_result is None:
+        routing_result = await Runner.run(routerAgent, query)
     agent_name = (routing_result.final_output or "").strip().lower()
 
     Agents = {
@@ -707,6 +708,29 @@ async def main(query: str) -> str:
     return routing_result.final_output or ""
 
 
+async def main_stream(query: str):
+    """
+    Streaming main(). Notion answers arrive as a {"type": "sources"} event
+    followed by {"type": "token", "text"} events; every route ends with
+    {"type": "done", "response": str}, the string main() would return.
+    """
+    routing_result = await Runner.run(routerAgent, query)
+    agent_name = (routing_result.final_output or "").strip().lower()
+
+    if agent_name != "notionagent":
+        yield {"type": "done", "response": await main(query, routing_result)}
+        return
+
+    try:
+        async for event in run_search_stream(query):
+            if event["type"] == "done":
+                yield {"type": "done", "response": event["answer"]}
+            else:
+                yield event
+    except Exception as e:
+        yield {"type": "done", "response": f"❌ Notion error: {e}"}
+
+
 
 async def main_loop():
     global model, notionAgent, macAgent, workflowAgent, routerAgent
@@ -750,7 +774,9 @@ async def main_loop():
 
         # ---------- NORMAL CHAT (ALWAYS ROUTER FIRST) ----------
         try:
-            await main(q)
+            # Notion answers print as they stream (run_search_stream).
+            async for _ in main_stream(q):
+                pass
         except Exception as e:
             print(f"❌ Runtime error: {e}")
 
@@ -0,0 +1,183 @@
+# bench_ef.py
+#
+# Recall@k and knn_query latency of the published HNSW index across an
+# ef / k sweep, against exact brute-force neighbours:
+#
+#   python bench_ef.py --queries 200 --efs 16,32,64,128,256,512 --ks 8,50
+#
+# With --write, the cheapest ef whose recall@k (k = search's candidate
+# count) reaches --target is stored in the index manifest, both live and
+# in the current snapshot; search applies it on its next reload poll and
+# the indexer keeps it in later manifests.
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import hnswlib
+
+from chunk_store import ChunkStore
+from manifest import read_manifest, update_manifest
+from snapshots import current_snapshot, snapshot_path
+from vector_store import normalize
+
+ARTIFACTS_DIR = "artifacts"
+INDEX_NAME = "notion_hnsw_hnswlib.index"
+SEARCH_CANDIDATES = int(os.getenv("RAG_SEARCH_CANDIDATES", "50"))
+BRUTE_BLOCK = 65536
+
+def open_published():
+    """
+    (directory, manifest, index, stored vectors, their labels) of the
+    current snapshot, or of the live artifacts before snapshots existed.
+    """
+    name = current_snapshot(ARTIFACTS_DIR)
+    directory = snapshot_path(ARTIFACTS_DIR, name) if name else ARTIFACTS_DIR
+    index_path = os.path.join(directory, INDEX_NAME)
+    manifest = read_manifest(index_path)
+    if not manifest:
+        raise SystemExit(f"no index manifest in {directory}; run main.py first")
+
+    dim = manifest["dim"]
+    idx = hnswlib.Index(space=manifest.get("space", "cosine"), dim=dim)
+    idx.load_index(index_path)
+    idx.set_num_threads(1)
+
+    # Labels outgrow the HNSW slot count once freed slots are reused and
+    # near-duplicates share elements: bound by the snapshot's labels.
+    vecs = np.memmap(os.path.join(directory, "vectors.f32"), dtype="float32", mode="r")
+    vecs = vecs[: (len(vecs) // dim) * dim].reshape(-1, dim)
+    vecs = vecs[:manifest.get("labels", len(vecs))]
+
+    # Ground truth over HNSW elements: near-duplicate rows reuse another
+    # row's element, which outlives that row while they are active.
+    store = ChunkStore(directory)
+    flags = np.array(store.active_flags()[:len(vecs)])
+    shared = store.shared_rows()
+    for label, vector in shared.items():
+        if label < len(flags) and flags[label]:
+            flags[vector] = 1
+    for label in shared:
+        if label < len(flags):
+            flags[label] = 0
+    labels = np.flatnonzero(flags == 1)
+    labels = labels[np.linalg.norm(vecs[labels], axis=1) > 0]
+    print(f"[bench] {directory}: {len(labels)} active vectors, dim {dim}, ef {manifest.get('ef')}")
+    return directory, manifest, idx, vecs, labels
+
+def exact_topk(vecs, labels, queries, k):
+    """
+    Brute-force cosine top-k over the active rows, scanned in blocks.
+    """
+    best_s = np.full((len(queries), 0), -np.inf, dtype="float32")
+    best_l = np.empty((len(queries), 0), dtype="int64")
+    for s in range(0, len(labels), BRUTE_BLOCK):
+        block = labels[s:s + BRUTE_BLOCK]
+        sims = queries @ normalize(np.asarray(vecs[block])).T
+        cand_s = np.concatenate([best_s, sims], axis=1)
+        cand_l = np.concatenate([best_l, np.broadcast_to(block, sims.shape)], axis=1)
+        m = min(k, cand_s.shape[1])
+        top = np.argpartition(-cand_s, m - 1, axis=1)[:, :m]
+        best_s = np.take_along_axis(cand_s, top, axis=1)
+        best_l = np.take_along_axis(cand_l, top, axis=1)
+    return [set(row.tolist()) for row in best_l]
+
+def sweep(idx, queries, truth, efs, ks):
+    rows = []
+    for k in ks:
+        # hnswlib searches with max(ef, k)
+        for ef in sorted({max(ef, k) for ef in efs}):
+            idx.set_ef(ef)
+            found, times = [], []
+            for q in queries:
+                t = time.perf_counter()
+                lab, _ = idx.knn_query(q, k=k)
+                times.append((time.perf_counter() - t) * 1000)
+                found.append(lab[0])
+            hits = sum(len(set(int(x) for x in f) & set(t)) for f, t in zip(found, truth[k]))
+            rows.append({
+                "k": k,
+                "ef": ef,
+                "recall": hits / sum(len(t) for t in truth[k]),
+                "p50_ms": float(np.percentile(times, 50)),
+                "p99_ms": float(np.percentile(times, 99)),
+            })
+    return rows
+
+def pick_ef(rows, k, target):
+    ok = [r for r in rows if r["k"] == k and r["recall"] >= target]
+    return min(ok, key=lambda r: (r["ef"], r["p99_ms"])) if ok else None
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="HNSW recall/latency sweep and ef tuning")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--efs", default="16,32,64,128,256,512")
+    ap.add_argument("--ks", default=f"8,{SEARCH_CANDIDATES}")
+    ap.add_argument("--k", type=int, default=SEARCH_CANDIDATES, help="k the tuned ef must serve")
+    ap.add_argument("--target", type=float, default=0.95, help="recall@k to reach")
+    ap.add_argument("--noise", type=float, default=0.05, help="perturbation of sampled queries")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--write", action="store_true", help="store the chosen ef in the manifest")
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args(argv)
+
+    directory, manifest, idx, vecs, labels = open_published()
+    efs = sorted({int(x) for x in args.efs.split(",")})
+    ks = sorted({int(x) for x in args.ks.split(",")} | {args.k})
+    ks = [k for k in ks if k <= len(labels)]
+    if not ks:
+        raise SystemExit("index holds fewer vectors than the smallest k")
+
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(labels, size=min(args.queries, len(labels)), replace=False)
+    queries = np.asarray(vecs[picks], dtype="float32")
+    queries = normalize(queries + args.noise * rng.normal(size=queries.shape).astype("float32"))
+
+    t = time.perf_counter()
+    exact = exact_topk(vecs, labels, queries, max(ks))
+    print(f"[bench] brute force for {len(queries)} queries: {time.perf_counter() - t:.1f}s")
+    # Ground truth per k, ranked so the first k of the max-k set are the top-k.
+    ranked = []
+    for q, cand in zip(queries, exact):
+        cand = np.fromiter(cand, dtype="int64")
+        order = np.argsort(-(normalize(np.asarray(vecs[cand])) @ q))
+        ranked.append(cand[order].tolist())
+    truth = {k: [r[:k] for r in ranked] for k in ks}
+
+    rows = sweep(idx, queries, truth, efs, ks)
+    print(f"\n{'k':>4} {'ef':>6} {'recall':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in rows:
+        print(f"{r['k']:>4} {r['ef']:>6} {r['recall']:>8.4f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+
+    best = pick_ef(rows, args.k, args.target) if args.k in ks else None
+    if best is None:
+        print(f"\n[bench] no ef in the sweep reaches recall@{args.k} >= {args.target}")
+    else:
+        print(f"\n[bench] cheapest ef for recall@{args.k} >= {args.target}: {best['ef']} "
+              f"(recall {best['recall']:.4f}, p99 {best['p99_ms']:.3f} ms)")
+
+    if args.write and best is not None:
+        tuning = {
+            "k": args.k,
+            "target": args.target,
+            "recall": round(best["recall"], 4),
+            "p50_ms": round(best["p50_ms"], 4),
+            "p99_ms": round(best["p99_ms"], 4),
+            "count": int(len(labels)),
+            "tuned_at": time.time(),
+        }
+        paths = {os.path.join(directory, INDEX_NAME), os.path.join(ARTIFACTS_DIR, INDEX_NAME)}
+        for p in paths:
+            if read_manifest(p):
+                update_manifest(p, ef=best["ef"], ef_tuning=tuning)
+        print(f"[bench] wrote ef={best['ef']} to {len(paths)} manifest(s)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"n": int(len(labels)), "queries": len(queries), "results": rows,
+                       "chosen": best}, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
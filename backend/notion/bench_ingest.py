@@ -0,0 +1,380 @@
+# bench_ingest.py
+#
+# Offline benchmark of bootstrap_full_index against local fakes:
+#
+#   fake Notion   synthetic workspace (pages x blocks x depth) served over
+#                 /v1/search and /v1/blocks/{id}/children, with injected
+#                 429s, 502s and per-request latency
+#   fake Ollama   /api/embed returning deterministic vectors after a
+#                 configurable per-call + per-input delay
+#
+# main.py runs unmodified in a child process (NOTION_API_BASE / OLLAMA_HOST
+# point it at the fakes, artifacts go to a temp dir). Each run appends one
+# JSON line tagged with the git commit to --out, so results can be
+# compared across commits:
+#
+#   python bench_ingest.py --pages 50 --blocks 40 --depth 2
+#   python bench_ingest.py --pages 200 --p429 0.02 --p502 0.01 --notion-ms 80
+
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+NOTION_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_MARKER = "__BENCH__"
+
+WORDS = (
+    "meeting notes roadmap design review launch customer feedback budget "
+    "hiring plan sprint retro incident postmortem metrics latency search "
+    "index embedding notion agent workflow deadline owner action item "
+    "decision risk dependency milestone draft spec api migration"
+).split()
+
+# ============================================================
+# SYNTHETIC WORKSPACE
+# ============================================================
+
+def block_id(*parts):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "/".join(map(str, parts))))
+
+def rich(text):
+    return [{"type": "text", "plain_text": text, "text": {"content": text}}]
+
+class Workspace:
+    """
+    Deterministic pages and block trees. Every `child_every`-th block has
+    `blocks // 4` children, down to `depth` levels.
+    """
+
+    def __init__(self, pages, blocks, depth, child_every, words, seed):
+        self.rng = random.Random(seed)
+        self.children = {}
+        self.pages = []
+        now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+        for p in range(pages):
+            pid = block_id("page", seed, p)
+            edited = now - timedelta(minutes=p)
+            self.pages.append({
+                "object": "page",
+                "id": pid,
+                "url": f"https://www.notion.so/{pid.replace('-', '')}",
+                "last_edited_time": edited.strftime("%Y-%m-%dT%H:%M:00.000Z"),
+            })
+            self._fill(pid, blocks, depth, child_every, words)
+
+        self.block_count = sum(len(v) for v in self.children.values())
+
+    def _fill(self, parent, n, depth, child_every, words):
+        kids = []
+        for i in range(n):
+            bid = block_id(parent, i)
+            has_children = depth > 1 and child_every and i % child_every == child_every - 1
+            kind = "heading_2" if i % 12 == 0 else (
+                "bulleted_list_item" if i % 3 == 0 else "paragraph"
+            )
+            text = " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(words // 2, words)))
+            kids.append({
+                "object": "block",
+                "id": bid,
+                "type": kind,
+                "has_children": bool(has_children),
+                kind: {"rich_text": rich(text)},
+            })
+            if has_children:
+                self._fill(bid, max(1, n // 4), depth - 1, child_every, words)
+        self.children[parent] = kids
+
+# ============================================================
+# FAKE SERVERS
+# ============================================================
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def add(self, key, n=1):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + n
+
+    def get(self, key):
+        return self.values.get(key, 0)
+
+def serve(handler_cls):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def notion_handler(ws, args, counters):
+    faults = random.Random(args.seed + 1)
+    faults_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def _reply(self, status, body, headers=()):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers:
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _fault(self):
+            counters.add("notion_requests")
+            if args.notion_ms:
+                time.sleep(args.notion_ms / 1000)
+            with faults_lock:
+                roll = faults.random()
+            if roll < args.p429:
+                counters.add("notion_429")
+                self._reply(429, {"code": "rate_limited"}, [("Retry-After", str(args.retry_after))])
+                return True
+            if roll < args.p429 + args.p502:
+                counters.add("notion_502")
+                self._reply(502, {"code": "bad_gateway"})
+                return True
+            return False
+
+        def _page(self, items, cursor, size):
+            start = int(cursor or 0)
+            end = start + size
+            return {
+                "object": "list",
+                "results": items[start:end],
+                "has_more": end < len(items),
+                "next_cursor": str(end) if end < len(items) else None,
+            }
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self._fault():
+                return
+            if urlparse(self.path).path != "/v1/search":
+                return self._reply(404, {"code": "object_not_found"})
+            counters.add("notion_search")
+            # The synthetic workspace is pages only: no databases, no rows.
+            kind = (body.get("filter") or {}).get("value", "page")
+            pages = sorted(ws.pages, key=lambda p: p["last_edited_time"], reverse=True)
+            items = pages if kind == "page" else []
+            self._reply(200, self._page(items, body.get("start_cursor"), body.get("page_size", 100)))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if self._fault():
+                return
+            parts = url.path.strip("/").split("/")
+            if len(parts) != 4 or parts[:2] != ["v1", "blocks"] or parts[3] != "children":
+                return self._reply(404, {"code": "object_not_found"})
+            counters.add("notion_children")
+            q = parse_qs(url.query)
+            kids = ws.children.get(parts[2], [])
+            self._reply(200, self._page(
+                kids, q.get("start_cursor", [None])[0], int(q.get("page_size", ["100"])[0])
+            ))
+
+    return Handler
+
+def ollama_handler(args, counters):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if urlparse(self.path).path != "/api/embed":
+                self.send_response(404)
+                self.end_headers()
+                return
+            inputs = body.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            counters.add("embed_calls")
+            counters.add("embed_inputs", len(inputs))
+            time.sleep((args.embed_ms + args.embed_item_ms * len(inputs)) / 1000)
+
+            vecs = [
+                np.random.default_rng(zlib.crc32(t.encode())).normal(size=args.dim).round(6).tolist()
+                for t in inputs
+            ]
+            data = json.dumps({"model": body.get("model"), "embeddings": vecs}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+# ============================================================
+# RUN
+# ============================================================
+
+CHILD = f"""
+import sys, time, json
+sys.path.insert(0, {NOTION_DIR!r})
+import main
+t = time.perf_counter()
+main.bootstrap_full_index()
+seconds = time.perf_counter() - t
+print({BENCH_MARKER!r}, json.dumps({{"seconds": seconds, "chunks": len(main.chunk_store)}}))
+main.index_writer.close()
+"""
+
+def git_commit():
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=NOTION_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=NOTION_DIR,
+            capture_output=True, text=True
+        ).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+def run_bootstrap(args, notion_url, ollama_url, workdir):
+    env = dict(
+        os.environ,
+        NOTION_TOKEN="bench",
+        NOTION_API_BASE=notion_url,
+        OLLAMA_HOST=ollama_url,
+        NOTION_RATE_PER_SEC=str(args.rate),
+        NOTION_RATE_BURST=str(max(1, int(args.rate))),
+        RAG_EMBED_CACHE_PATH=os.path.join(workdir, "cache", "embeddings.db"),
+        PYTHONUNBUFFERED="1",
+    )
+    log_path = os.path.join(workdir, "bootstrap.log")
+    with open(log_path, "w") as log:
+        proc = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=workdir, env=env,
+            stdout=subprocess.PIPE, stderr=log, text=True
+        )
+        log.write(proc.stdout)
+
+    if proc.returncode != 0:
+        with open(log_path) as f:
+            tail = f.read()[-3000:]
+        raise RuntimeError(f"bootstrap exited with {proc.returncode}:\n{tail}")
+
+    for line in proc.stdout.splitlines():
+        if line.startswith(BENCH_MARKER):
+            return json.loads(line[len(BENCH_MARKER):])
+    raise RuntimeError("bootstrap did not report results")
+
+def previous_result(path, config):
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path) as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            if r.get("config") == config:
+                last = r
+    return last
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline bootstrap ingestion benchmark")
+    ap.add_argument("--pages", type=int, default=50)
+    ap.add_argument("--blocks", type=int, default=40, help="top-level blocks per page")
+    ap.add_argument("--depth", type=int, default=2, help="block tree depth")
+    ap.add_argument("--child-every", type=int, default=10, help="every Nth block has children")
+    ap.add_argument("--words", type=int, default=24, help="max words per block")
+    ap.add_argument("--notion-ms", type=float, default=20.0, help="latency per Notion request")
+    ap.add_argument("--p429", type=float, default=0.01)
+    ap.add_argument("--p502", type=float, default=0.005)
+    ap.add_argument("--retry-after", type=float, default=0.5)
+    ap.add_argument("--rate", type=float, default=float(os.getenv("NOTION_RATE_PER_SEC", "3")),
+                    help="client-side Notion requests/s")
+    ap.add_argument("--embed-ms", type=float, default=30.0, help="latency per embed call")
+    ap.add_argument("--embed-item-ms", type=float, default=2.0, help="extra latency per input")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--keep", action="store_true", help="keep the work directory")
+    ap.add_argument("--out", default="bench_ingest.jsonl", help="append results here")
+    args = ap.parse_args(argv)
+
+    ws = Workspace(args.pages, args.blocks, args.depth, args.child_every, args.words, args.seed)
+    print(f"[bench] workspace: {len(ws.pages)} pages, {ws.block_count} blocks")
+
+    counters = Counters()
+    notion = serve(notion_handler(ws, args, counters))
+    ollama = serve(ollama_handler(args, counters))
+    notion_url = f"http://127.0.0.1:{notion.server_address[1]}/v1"
+    ollama_url = f"http://127.0.0.1:{ollama.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        t = time.perf_counter()
+        child = run_bootstrap(args, notion_url, ollama_url, workdir)
+        wall = time.perf_counter() - t
+    finally:
+        notion.shutdown()
+        ollama.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    seconds = child["seconds"]
+    pages = len(ws.pages)
+    metrics = {
+        "seconds": round(seconds, 3),
+        "wall_seconds": round(wall, 3),
+        "pages_per_sec": round(pages / seconds, 3),
+        "chunks": child["chunks"],
+        "chunks_per_sec": round(child["chunks"] / seconds, 3),
+        "api_calls": counters.get("notion_requests"),
+        "api_calls_per_page": round(counters.get("notion_requests") / pages, 3),
+        "notion_429": counters.get("notion_429"),
+        "notion_502": counters.get("notion_502"),
+        "embed_calls": counters.get("embed_calls"),
+        "embed_inputs": counters.get("embed_inputs"),
+        # Linux reports KiB; the only child of this process is the bootstrap.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+    config = {k: v for k, v in vars(args).items() if k not in ("keep", "out")}
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "metrics": metrics,
+    }
+
+    prev = previous_result(args.out, config)
+    print(f"\n{'metric':<20} {'value':>12}" + (f" {'prev (' + prev['commit'] + ')':>20}" if prev else ""))
+    for k, v in metrics.items():
+        line = f"{k:<20} {v:>12}"
+        if prev and k in prev["metrics"]:
+            line += f" {prev['metrics'][k]:>20}"
+        print(line)
+
+    with open(args.out, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"\n[bench] appended to {args.out}")
+
+if __name__ == "__main__":
+    sys.exit(main())
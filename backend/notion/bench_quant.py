@@ -0,0 +1,129 @@
+# bench_quant.py
+#
+# Recall@k and memory of the vector layouts the search path can use:
+#
+#   hnsw-f32   current layout: float32 hnswlib graph (M=32, ef=256)
+#   int8       int8 coarse scan + exact float32 rerank
+#   float16    float16 coarse scan + exact float32 rerank
+#
+# Uses artifacts/vectors.f32 when present, otherwise synthetic data:
+#
+#   python bench_quant.py --k 8 --queries 200
+#   python bench_quant.py --synthetic 50000 --dim 384 --out quant.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+import hnswlib
+
+from manifest import read_manifest
+from vector_store import VectorStore, hnsw_element_bytes, normalize
+
+ARTIFACTS_DIR = "artifacts"
+INDEX_PATH = os.path.join(ARTIFACTS_DIR, "notion_hnsw_hnswlib.index")
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF = 256
+HNSW_CAPACITY = 1_000_000  # the fixed capacity load_or_create_index used to reserve
+
+def load_vectors(args):
+    manifest = read_manifest(INDEX_PATH)
+    path = os.path.join(ARTIFACTS_DIR, "vectors.f32")
+    if not args.synthetic and manifest and os.path.exists(path):
+        vecs = np.fromfile(path, dtype="float32").reshape(-1, manifest["dim"])
+        vecs = vecs[np.linalg.norm(vecs, axis=1) > 0]
+        print(f"[bench] {len(vecs)} stored vectors, dim {vecs.shape[1]}")
+        return vecs
+
+    n = args.synthetic or 20000
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(max(1, n // 50), args.dim))
+    vecs = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.normal(size=(n, args.dim))
+    print(f"[bench] {n} synthetic vectors, dim {args.dim}")
+    return normalize(vecs)
+
+def exact_topk(vecs, queries, k):
+    sims = queries @ vecs.T
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+def recall(found, truth):
+    hits = sum(len(set(int(x) for x in f) & t) for f, t in zip(found, truth))
+    return hits / sum(len(t) for t in truth)
+
+def bench_hnsw(vecs, queries, truth, k):
+    idx = hnswlib.Index(space="cosine", dim=vecs.shape[1])
+    idx.init_index(max_elements=len(vecs), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+    idx.add_items(vecs, np.arange(len(vecs)))
+    idx.set_ef(HNSW_EF)
+
+    t = time.perf_counter()
+    found = [idx.knn_query(q, k=k)[0][0] for q in queries]
+    ms = (time.perf_counter() - t) * 1000 / len(queries)
+
+    per = hnsw_element_bytes(vecs.shape[1], HNSW_M)
+    return {
+        "layout": "hnsw-f32",
+        "recall": recall(found, truth),
+        "ms_per_query": ms,
+        "resident_bytes": per * len(vecs),
+        "resident_bytes_1m_capacity": per * HNSW_CAPACITY,
+    }
+
+def bench_quant(vecs, queries, truth, k, quant, rerank):
+    with tempfile.TemporaryDirectory() as d:
+        store = VectorStore(d, vecs.shape[1], quant, writable=True)
+        store.write(0, vecs)
+        store.refresh()
+
+        t = time.perf_counter()
+        found = [store.search(q, k, rerank=rerank)[0][0] for q in queries]
+        ms = (time.perf_counter() - t) * 1000 / len(queries)
+
+        return {
+            "layout": quant,
+            "recall": recall(found, truth),
+            "ms_per_query": ms,
+            "resident_bytes": store.resident_bytes(),
+            "mmap_bytes": store.full.nbytes,
+        }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Recall@k and memory of search vector layouts")
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--rerank", type=int, default=200)
+    ap.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args(argv)
+
+    vecs = load_vectors(args)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(len(vecs), size=min(args.queries, len(vecs)), replace=False)
+    queries = normalize(vecs[picks] + 0.05 * rng.normal(size=(len(picks), vecs.shape[1])))
+    truth = exact_topk(vecs, queries, args.k)
+
+    results = [bench_hnsw(vecs, queries, truth, args.k)]
+    for quant in ("int8", "float16"):
+        results.append(bench_quant(vecs, queries, truth, args.k, quant, args.rerank))
+
+    print(f"\n{'layout':<10} {'recall@' + str(args.k):>10} {'ms/query':>10} {'resident MB':>12}")
+    for r in results:
+        print(f"{r['layout']:<10} {r['recall']:>10.4f} {r['ms_per_query']:>10.3f} "
+              f"{r['resident_bytes'] / 2**20:>12.1f}")
+    print(f"(hnsw-f32 with the old fixed 1M capacity reserved "
+          f"{results[0]['resident_bytes_1m_capacity'] / 2**20:.0f} MB)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"n": len(vecs), "dim": vecs.shape[1], "k": args.k, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+# chunk_store.py
+import os
+import json
+import uuid
+import numpy as np
+
+# ============================================================
+# COLUMNAR CHUNK METADATA
+# ============================================================
+#
+# One row per label, stored column by column under `directory`:
+#
+#   chunks.page_ids    16-byte page UUIDs
+#   chunks.block_ids   16-byte block UUIDs
+#   chunks.url_ids     uint32 index into chunks.urls
+#   chunks.created_at  float64 epoch seconds
+#   chunks.active      uint8 flag (0 = tombstoned)
+#   chunks.text_ends   uint64 end offset of each row in chunks.text
+#   chunks.text        UTF-8 chunk texts, back to back
+#   chunks.urls        interned URLs, one per line
+#   chunks.shared      uint64 (label, vector label) pairs for rows that
+#                      reuse another row's HNSW element (near-duplicates)
+#
+# Every column is fixed width and memory-mapped, so reading row `label`
+# is O(1) and nothing is parsed at startup except the URL and shared
+# tables. A row's label is its HNSW label unless it is listed in
+# chunks.shared.
+
+ID_DTYPE = np.dtype("V16")
+SHARED_DTYPE = np.dtype("<u8")
+
+COLUMNS = {
+    "page_ids": ID_DTYPE,
+    "block_ids": ID_DTYPE,
+    "url_ids": np.dtype("<u4"),
+    "created_at": np.dtype("<f8"),
+    "active": np.dtype("u1"),
+    "text_ends": np.dtype("<u8"),
+}
+
+def _id_bytes(s: str) -> bytes:
+    return uuid.UUID(s).bytes if s else bytes(16)
+
+def _id_str(b) -> str:
+    b = bytes(b)
+    return str(uuid.UUID(bytes=b)) if any(b) else ""
+
+class ChunkStore:
+    def __init__(self, directory, writable=False):
+        self.directory = directory
+        self.writable = writable
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+
+        self._urls = []
+        self._url_ids = {}
+        self._urls_read = 0
+        self._vector_of = {}
+        self._sharers = {}
+        self._shared_read = 0
+
+        if writable:
+            self._repair()
+        self.refresh()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"chunks.{name}")
+
+    def _intern(self, url):
+        i = self._url_ids.get(url)
+        if i is None:
+            i = len(self._urls)
+            self._urls.append(url)
+            self._url_ids[url] = i
+        return i
+
+    @staticmethod
+    def snapshot_files():
+        """
+        (append-only files, files mutated in place) for publish_snapshot.
+        """
+        link = [f"chunks.{n}" for n in COLUMNS if n != "active"]
+        return link + ["chunks.text", "chunks.urls", "chunks.shared"], ["chunks.active"]
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, "chunks.text_ends"))
+
+    def _rows_on_disk(self):
+        n = None
+        for name, dtype in COLUMNS.items():
+            p = self._path(name)
+            rows = os.path.getsize(p) // dtype.itemsize if os.path.exists(p) else 0
+            n = rows if n is None else min(n, rows)
+        return n
+
+    def _repair(self):
+        """
+        Truncate every column to the number of complete rows, undoing a
+        partially written append.
+        """
+        n = self._rows_on_disk()
+        for name, dtype in COLUMNS.items():
+            p = self._path(name)
+            with open(p, "ab") as f:
+                f.truncate(n * dtype.itemsize)
+        ends = np.fromfile(self._path("text_ends"), dtype=COLUMNS["text_ends"])
+        with open(self._path("text"), "ab") as f:
+            f.truncate(int(ends[n - 1]) if n else 0)
+        shared = self._path("shared")
+        if os.path.exists(shared):
+            pairs = np.fromfile(shared, dtype=SHARED_DTYPE)
+            pairs = pairs[:len(pairs) // 2 * 2].reshape(-1, 2)
+            keep = int(np.count_nonzero(pairs[:, 0] < n))
+            with open(shared, "ab") as f:
+                f.truncate(keep * 2 * SHARED_DTYPE.itemsize)
+
+    def refresh(self):
+        """
+        (Re)map the columns; call after another process appended rows.
+        """
+        self._n = self._rows_on_disk() if self.exists(self.directory) else 0
+        self._cols = {}
+        for name, dtype in COLUMNS.items():
+            self._cols[name] = (
+                np.memmap(self._path(name), dtype=dtype, mode="r", shape=(self._n,))
+                if self._n else np.empty(0, dtype=dtype)
+            )
+        size = os.path.getsize(self._path("text")) if self._n else 0
+        self._text = (
+            np.memmap(self._path("text"), dtype="u1", mode="r", shape=(size,))
+            if size else np.empty(0, dtype="u1")
+        )
+        self._load_new_urls()
+        self._load_new_shared()
+
+    def _load_new_urls(self):
+        p = self._path("urls")
+        if not os.path.exists(p):
+            return
+        with open(p, "rb") as f:
+            f.seek(self._urls_read)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # writer mid-append
+                self._intern(line[:-1].decode("utf-8"))
+                self._urls_read += len(line)
+
+    def _load_new_shared(self):
+        p = self._path("shared")
+        if not os.path.exists(p):
+            return
+        pair = 2 * SHARED_DTYPE.itemsize
+        with open(p, "rb") as f:
+            f.seek(self._shared_read)
+            data = f.read()
+        pairs = np.frombuffer(data[:len(data) // pair * pair], dtype=SHARED_DTYPE).reshape(-1, 2)
+        for label, vector in pairs.tolist():
+            if label >= self._n:
+                break  # row not complete yet
+            self._vector_of[label] = vector
+            self._sharers.setdefault(vector, []).append(label)
+            self._shared_read += pair
+
+    def __len__(self):
+        return self._n
+
+    # ---------------- reads ----------------
+
+    def text(self, label):
+        ends = self._cols["text_ends"]
+        start = int(ends[label - 1]) if label else 0
+        return bytes(self._text[start:int(ends[label])]).decode("utf-8")
+
+    def url(self, label):
+        return self._urls[int(self._cols["url_ids"][label])]
+
+    def is_active(self, label):
+        return bool(self._cols["active"][label])
+
+    def get(self, label):
+        """
+        Row `label` as the dict shape meta.jsonl used to hold.
+        """
+        label = int(label)
+        return {
+            "page_id": _id_str(self._cols["page_ids"][label]),
+            "url": self.url(label),
+            "block_id": _id_str(self._cols["block_ids"][label]),
+            "text": self.text(label),
+            "created_at": float(self._cols["created_at"][label]),
+            "active": self.is_active(label),
+        }
+
+    def __getitem__(self, label):
+        return self.get(label)
+
+    def active_flags(self):
+        """
+        The memory-mapped uint8 active column (index by label).
+        """
+        return self._cols["active"]
+
+    def active_labels(self):
+        return np.flatnonzero(self._cols["active"])
+
+    def vector_of(self, label):
+        """
+        Label of the HNSW element holding row `label`'s vector.
+        """
+        return self._vector_of.get(int(label), int(label))
+
+    def sharers(self, vector):
+        """
+        Rows other than `vector` itself that reuse its HNSW element.
+        """
+        return self._sharers.get(int(vector), ())
+
+    def shared_rows(self):
+        """
+        {label: vector label} of every row that reuses another's element.
+        """
+        return self._vector_of
+
+    # ---------------- writes ----------------
+
+    def append(self, metas):
+        """
+        Append rows (dicts with page_id, block_id, url, text, created_at,
+        active and, for near-duplicates, vector_of); returns the label of
+        the first one.
+        """
+        first = self._n
+        if not metas:
+            return first
+
+        new_urls = []
+        url_ids = []
+        for m in metas:
+            url = m.get("url", "")
+            before = len(self._urls)
+            url_ids.append(self._intern(url))
+            if len(self._urls) > before:
+                new_urls.append(url)
+
+        shared = np.array(
+            [(first + i, m["vector_of"]) for i, m in enumerate(metas)
+             if m.get("vector_of") is not None],
+            dtype=SHARED_DTYPE
+        )
+        texts = [m.get("text", "").encode("utf-8") for m in metas]
+        base = int(self._cols["text_ends"][-1]) if self._n else 0
+        ends = base + np.cumsum([len(t) for t in texts], dtype="<u8")
+
+        columns = {
+            "page_ids": np.array([_id_bytes(m.get("page_id", "")) for m in metas], dtype=ID_DTYPE),
+            "block_ids": np.array([_id_bytes(m.get("block_id", "")) for m in metas], dtype=ID_DTYPE),
+            "url_ids": np.array(url_ids, dtype=COLUMNS["url_ids"]),
+            "created_at": np.array([m.get("created_at", 0.0) for m in metas], dtype=COLUMNS["created_at"]),
+            "active": np.array([1 if m.get("active", True) else 0 for m in metas], dtype=COLUMNS["active"]),
+        }
+
+        # URLs and text first, text_ends last: a row only counts once its
+        # end offset is written (see _repair).
+        if new_urls:
+            data = "".join(url.replace("\n", " ") + "\n" for url in new_urls).encode("utf-8")
+            with open(self._path("urls"), "ab") as f:
+                f.write(data)
+            self._urls_read += len(data)
+        if len(shared):
+            with open(self._path("shared"), "ab") as f:
+                f.write(shared.tobytes())
+        with open(self._path("text"), "ab") as f:
+            f.write(b"".join(texts))
+        for name, arr in columns.items():
+            with open(self._path(name), "ab") as f:
+                f.write(arr.tobytes())
+        with open(self._path("text_ends"), "ab") as f:
+            f.write(ends.tobytes())
+
+        self.refresh()
+        return first
+
+    def set_active(self, labels, active=False):
+        labels = [int(l) for l in labels if 0 <= int(l) < self._n]
+        if not labels:
+            return
+        flag = b"\x01" if active else b"\x00"
+        with open(self._path("active"), "r+b") as f:
+            for label in sorted(labels):
+                f.seek(label)
+                f.write(flag)
+
+    # ---------------- migration ----------------
+
+    def import_jsonl(self, meta_path, tombstones=()):
+        """
+        One-off import of a legacy meta.jsonl (line number == label).
+        """
+        tombstones = set(tombstones)
+        batch = []
+        with open(meta_path, "r", encoding="utf-8") as f:
+            for label, line in enumerate(f):
+                m = json.loads(line)
+                if label in tombstones:
+                    m["active"] = False
+                batch.append(m)
+                if len(batch) >= 10_000:
+                    self.append(batch)
+                    batch = []
+        self.append(batch)
@@ -0,0 +1,94 @@
+# embed_cache.py
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# ============================================================
+# CONTENT-ADDRESSED EMBEDDING CACHE
+# ============================================================
+
+class EmbeddingCache:
+    """
+    Persistent (model, sha256(text)) -> float32 vector map in SQLite.
+
+    Keys depend only on the embedding model and the exact text sent to
+    it, so the cache survives index rebuilds and chunking changes. Keep
+    it outside the artifacts directory so deleting artifacts/ does not
+    throw it away.
+    """
+
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vec BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """
+        Returns a list aligned with `texts`: a float32 vector or None.
+        """
+        keys = [self.key(t) for t in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self.LOOKUP_BATCH):
+                part = keys[i:i + self.LOOKUP_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vec FROM embeddings "
+                    f"WHERE model=? AND text_hash IN ({marks})",
+                    [model, *part]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype="float32")
+
+        out = [found.get(k) for k in keys]
+        hit = sum(v is not None for v in out)
+        self.hits += hit
+        self.misses += len(out) - hit
+        return out
+
+    def get(self, model, text):
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model, texts, vecs):
+        rows = [
+            (model, self.key(t), np.asarray(v, dtype="float32").tobytes())
+            for t, v in zip(texts, vecs)
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vec) "
+                    "VALUES (?, ?, ?)",
+                    rows
+                )
+
+    def put(self, model, text, vec):
+        self.put_many(model, [text], [vec])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,154 @@
+# lexical_index.py
+import os
+import re
+import sqlite3
+import threading
+
+# ============================================================
+# BM25 INVERTED INDEX (SQLITE FTS5)
+# ============================================================
+#
+#   artifacts/lexical.db    FTS5 table, rowid = chunk store label
+#
+# The indexer adds rows at each checkpoint and deletes tombstoned ones.
+# The file is mutated in place, so it is not part of the snapshots:
+# search opens the live file read-only and keeps only labels its own
+# snapshot has and still marks active.
+
+LEXICAL_DB = "lexical.db"
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i in is it
+its me my of on or our so that the their there this to was we what when
+where which who why will with you your
+""".split())
+
+TOKEN_RE = re.compile(r"[\w][\w.\-/:#]*[\w]|[\w]")
+
+def looks_like_identifier(token: str) -> bool:
+    """
+    Ticket ids, snake_case / camelCase names, versions, paths...
+    """
+    has_digit = any(c.isdigit() for c in token)
+    has_alpha = any(c.isalpha() for c in token)
+    return (
+        (has_digit and has_alpha)
+        or "_" in token
+        or re.search(r"[a-z][A-Z]", token) is not None
+        or re.search(r"\w[.\-/:#]\w", token) is not None
+    )
+
+def is_identifier_query(query: str) -> bool:
+    """
+    A quoted string, or at most two terms one of which looks like an
+    identifier: exact-term lookups that lexical search answers alone.
+    """
+    q = query.strip()
+    if len(q) > 2 and q[0] == q[-1] and q[0] in "\"'`":
+        return True
+    tokens = TOKEN_RE.findall(q)
+    return 0 < len(tokens) <= 2 and any(looks_like_identifier(t) for t in tokens)
+
+def query_identifiers(query: str) -> frozenset:
+    """
+    The identifier-like terms of a query, case-folded.
+    """
+    return frozenset(t.casefold() for t in TOKEN_RE.findall(query) if looks_like_identifier(t))
+
+def match_expression(query: str) -> str:
+    """
+    FTS5 MATCH string: any of the query's terms, each quoted so ids like
+    ABC-123 match as a phrase instead of being parsed as operators.
+    """
+    q = query.strip()
+    if len(q) > 2 and q[0] == q[-1] and q[0] in "\"'`":
+        terms = [q[1:-1]]
+    else:
+        terms = [t for t in TOKEN_RE.findall(q) if t.lower() not in STOPWORDS]
+    terms = list(dict.fromkeys(t.replace('"', '""') for t in terms if t.strip()))
+    return " OR ".join(f'"{t}"' for t in terms)
+
+class LexicalIndex:
+    def __init__(self, directory, writable=False):
+        self.path = os.path.join(directory, LEXICAL_DB)
+        self.writable = writable
+        self._lock = threading.Lock()
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                    "text, tokenize='unicode61 remove_diacritics 2')"
+                )
+        else:
+            self._conn = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+            )
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, LEXICAL_DB))
+
+    def empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+    # ---------------- writes ----------------
+
+    def add(self, first_label, texts):
+        """
+        Index texts under labels first_label, first_label + 1, ...
+        """
+        rows = [(first_label + i, t) for i, t in enumerate(texts)]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany("DELETE FROM chunks WHERE rowid=?", [(l,) for l, _ in rows])
+                self._conn.executemany("INSERT INTO chunks (rowid, text) VALUES (?, ?)", rows)
+
+    def remove(self, labels):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM chunks WHERE rowid=?", [(int(l),) for l in labels]
+                )
+
+    def backfill(self, store, batch=10000):
+        """
+        One-off: index the active chunks of a store built before this index.
+        """
+        if not self.empty() or not len(store):
+            return
+        labels = store.active_labels()
+        with self._lock:
+            with self._conn:
+                for s in range(0, len(labels), batch):
+                    self._conn.executemany(
+                        "INSERT INTO chunks (rowid, text) VALUES (?, ?)",
+                        [(int(l), store.text(l)) for l in labels[s:s + batch]]
+                    )
+        print(f"[RAG] backfilled {len(labels)} chunks into the lexical index")
+
+    # ---------------- search ----------------
+
+    def search(self, query, k=50):
+        """
+        [(label, bm25 score)] best first; bm25() is lower-is-better, so
+        scores are negated.
+        """
+        expr = match_expression(query)
+        if not expr:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rowid, bm25(chunks) FROM chunks WHERE chunks MATCH ? "
+                "ORDER BY bm25(chunks) LIMIT ?",
+                (expr, int(k))
+            ).fetchall()
+        return [(label, -score) for label, score in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,9 +1,13 @@
 import os
+import re
 import time
 import json
+import asyncio
 import threading
 import sqlite3
 import hashlib
+import struct
+import math
 import numpy as np
 import httpx
 import hnswlib
@@ -11,11 +15,15 @@ import ollama
 
 from dotenv import load_dotenv
 from tqdm import tqdm
-from notion_client import Client
-from notion_client.errors import APIResponseError, RequestTimeoutError
-from httpx import RemoteProtocolError
 from datetime import datetime
-from notion_client.errors import HTTPResponseError
+from collections import Counter
+
+from chunk_store import ChunkStore
+from embed_cache import EmbeddingCache
+from lexical_index import LexicalIndex
+from manifest import read_manifest, write_manifest
+from vector_store import VectorStore, hnsw_element_bytes
+from snapshots import publish_snapshot
 
 # ============================================================
 # ENV + CLIENTS
@@ -31,39 +39,94 @@ BLOCK_DB_PATH = os.path.join(ARTIFACTS_DIR, "blocks.db")
 META_PATH = os.path.join(ARTIFACTS_DIR, "meta.jsonl")
 HNSW_INDEX_PATH = os.path.join(ARTIFACTS_DIR, "notion_hnsw_hnswlib.index")
 PAGE_CKPT_PATH = os.path.join(ARTIFACTS_DIR, "page_checkpoint.json")
+TOMBSTONES_PATH = os.path.join(ARTIFACTS_DIR, "tombstones.txt")
 
-OLLAMA_EMBED_MODEL = "qllama/bge-small-en-v1.5"
-OLLAMA_HOST = "http://127.0.0.1:11435"
-
-httpx_client = httpx.Client(
-    timeout=httpx.Timeout(100.0, connect=15.0)
-)
+# Lives outside ARTIFACTS_DIR so a full index rebuild keeps it.
+EMBED_CACHE_PATH = os.getenv("RAG_EMBED_CACHE_PATH", os.path.join("cache", "embeddings.db"))
 
-notion = Client(
-    auth=os.getenv("NOTION_TOKEN"),
-    client=httpx_client
-)
+OLLAMA_EMBED_MODEL = "qllama/bge-small-en-v1.5"
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11435")
+DOC_PREFIX = "search_document: "
+OLLAMA_EMBED_BATCH = int(os.getenv("OLLAMA_EMBED_BATCH", "32"))
+OLLAMA_EMBED_MAX_BATCH = int(os.getenv("OLLAMA_EMBED_MAX_BATCH", "256"))
+
+HNSW_SPACE = "cosine"
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF = 256
+# Optional compressed copy of every vector ("int8" or "float16") that the
+# search process can scan instead of loading the float32 HNSW graph. The
+# indexer (bootstrap and daemon) still keeps the full graph in memory:
+# it maintains and publishes the index that RAG_SEARCH_BACKEND=hnsw uses.
+VECTOR_QUANT = os.getenv("RAG_VECTOR_QUANT") or None
+SNAPSHOT_KEEP = int(os.getenv("RAG_SNAPSHOT_KEEP", "3"))
+HNSW_CHECKPOINT_SECONDS = float(os.getenv("HNSW_CHECKPOINT_SECONDS", "120"))
+HNSW_CHECKPOINT_ITEMS = int(os.getenv("HNSW_CHECKPOINT_ITEMS", "5000"))
+HNSW_ADD_THREADS = int(os.getenv("HNSW_ADD_THREADS", str(os.cpu_count() or 1)))
+# Slots are reserved on demand: start small, grow by HNSW_GROWTH_FACTOR,
+# never past HNSW_MEMORY_BUDGET_MB (0 = no budget).
+HNSW_INITIAL_CAPACITY = int(os.getenv("HNSW_INITIAL_CAPACITY", "10000"))
+HNSW_GROWTH_FACTOR = float(os.getenv("HNSW_GROWTH_FACTOR", "1.5"))
+HNSW_MEMORY_BUDGET_MB = float(os.getenv("HNSW_MEMORY_BUDGET_MB", "0"))
+
+NOTION_TOKEN = os.getenv("NOTION_TOKEN")
+NOTION_API_BASE = os.getenv("NOTION_API_BASE", "https://api.notion.com/v1")
+NOTION_VERSION = "2022-06-28"
+
+# Notion allows an average of ~3 requests/s per integration.
+NOTION_RATE_PER_SEC = float(os.getenv("NOTION_RATE_PER_SEC", "3"))
+NOTION_RATE_BURST = int(os.getenv("NOTION_RATE_BURST", "3"))
+NOTION_MAX_IN_FLIGHT = int(os.getenv("NOTION_MAX_IN_FLIGHT", "8"))
+NOTION_PAGE_CONCURRENCY = int(os.getenv("NOTION_PAGE_CONCURRENCY", "4"))
+# children requests one crawl of a page may make before it stops and
+# leaves a frontier (a request budget, so time queued on the shared
+# limiter behind other pages doesn't count against the page)
+NOTION_PAGE_MAX_REQUESTS = int(os.getenv("NOTION_PAGE_MAX_REQUESTS", "100"))
+# last_edited_time is truncated to the minute, so re-list a little before
+# the watermark; pages whose stored edit time matches are skipped anyway.
+NOTION_WATERMARK_SLACK_SEC = float(os.getenv("NOTION_WATERMARK_SLACK_SEC", "120"))
+NOTION_SYNC_INTERVAL_SEC = float(os.getenv("NOTION_SYNC_INTERVAL_SEC", "600"))
+# Rows of a database walked for a body before its rows are treated as
+# property-only (rows already known to have a body are always walked).
+NOTION_DB_BODY_SAMPLE = int(os.getenv("NOTION_DB_BODY_SAMPLE", "20"))
+
+# Ingestion pipeline: queue depth between stages (pages), chunk/hash
+# workers, and how many chunks the embedder gathers per round.
+PIPELINE_QUEUE_SIZE = int(os.getenv("RAG_PIPELINE_QUEUE_SIZE", "16"))
+PIPELINE_CHUNK_WORKERS = int(os.getenv("RAG_PIPELINE_CHUNK_WORKERS", "2"))
+PIPELINE_EMBED_BATCH = int(os.getenv("RAG_PIPELINE_EMBED_BATCH", "256"))
+
+# Page chunker target, in approximate embedding tokens (~4/3 per word).
+CHUNK_TARGET_TOKENS = int(os.getenv("RAG_CHUNK_TARGET_TOKENS", "384"))
+
+# Chunks whose 64-bit SimHash differs in at most this many bits share one
+# vector (-1 disables). Capped at 3: signatures are looked up by four
+# 16-bit bands, one of which must then match exactly.
+NEAR_DUP_DISTANCE = min(int(os.getenv("RAG_NEAR_DUP_DISTANCE", "3")), 3)
+NEAR_DUP_MIN_WORDS = int(os.getenv("RAG_NEAR_DUP_MIN_WORDS", "12"))
 
 ollama_client = ollama.Client(
     host=OLLAMA_HOST,
     timeout=120
 )
 
+embed_cache = EmbeddingCache(EMBED_CACHE_PATH)
+
 # ============================================================
 # STATE + CHECKPOINTS
 # ============================================================
 
 def load_state():
     if not os.path.exists(STATE_PATH):
-        return {"last_sync_time": 0}
+        return {"watermark": 0}
     try:
         with open(STATE_PATH, "r") as f:
             data = f.read().strip()
             if not data:
-                return {"last_sync_time": 0}
+                return {"watermark": 0}
             return json.loads(data)
     except Exception:
-        return {"last_sync_time": 0}
+        return {"watermark": 0}
 
 def save_state(state):
     tmp = STATE_PATH + ".tmp"
@@ -72,56 +135,498 @@ def save_state(state):
     os.replace(tmp, STATE_PATH)
 
 def load_page_checkpoint():
+    """
+    Page ids from the JSON checkpoint that predates the crawl_done table
+    (legacy import only).
+    """
     if not os.path.exists(PAGE_CKPT_PATH):
         return set()
-    with open(PAGE_CKPT_PATH, "r") as f:
-        return set(json.load(f))
+    try:
+        with open(PAGE_CKPT_PATH, "r") as f:
+            return set(json.load(f))
+    except ValueError:
+        print("[RAG][WARN] page checkpoint unreadable; ignoring it")
+        return set()
 
-def save_page_checkpoint(done_pages):
-    with open(PAGE_CKPT_PATH, "w") as f:
-        json.dump(list(done_pages), f)
+def load_tombstones():
+    """
+    Labels tombstoned before the chunk store existed (legacy import only).
+    """
+    if not os.path.exists(TOMBSTONES_PATH):
+        return set()
+    with open(TOMBSTONES_PATH, "r") as f:
+        return {int(line) for line in f if line.strip()}
 
 # ============================================================
-# BLOCK HASH DB
+# CHUNK METADATA
 # ============================================================
 
-def init_block_db():
-    conn = sqlite3.connect(BLOCK_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS blocks (
-            block_id TEXT PRIMARY KEY,
-            page_id TEXT,
-            content_hash TEXT,
-            last_indexed REAL
-        )
-    """)
-    conn.commit()
-    conn.close()
+def open_chunk_store():
+    """
+    Columnar per-label metadata; imports a legacy meta.jsonl once.
+    """
+    store = ChunkStore(ARTIFACTS_DIR, writable=True)
+    if not len(store) and os.path.exists(META_PATH):
+        print("[RAG] importing meta.jsonl into the chunk store")
+        store.import_jsonl(META_PATH, load_tombstones())
+        os.replace(META_PATH, META_PATH + ".imported")
+    return store
+
+chunk_store = open_chunk_store()
+# BM25 over chunk texts, kept in step with the chunk store at checkpoints.
+lexical_index = LexicalIndex(ARTIFACTS_DIR, writable=True)
+
+# ============================================================
+# BLOCK HASH DB
+# ============================================================
 
 def hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-def block_changed(block_id: str, text: str) -> bool:
-    h = hash_text(text)
-    conn = sqlite3.connect(BLOCK_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT content_hash FROM blocks WHERE block_id=?", (block_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row is None or row[0] != h
-
-def update_block(block_id: str, page_id: str, text: str):
-    h = hash_text(text)
-    conn = sqlite3.connect(BLOCK_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT OR REPLACE INTO blocks
-        (block_id, page_id, content_hash, last_indexed)
-        VALUES (?, ?, ?, ?)
-    """, (block_id, page_id, h, time.time()))
-    conn.commit()
-    conn.close()
+SIMHASH_BANDS = 4
+_BIT_SHIFTS = np.arange(64, dtype="uint64")
+
+def simhash(text: str):
+    """
+    64-bit SimHash over word trigrams, or None for chunks too short to
+    compare reliably.
+    """
+    words = text.lower().split()
+    if NEAR_DUP_DISTANCE < 0 or len(words) < NEAR_DUP_MIN_WORDS:
+        return None
+    grams = (" ".join(words[i:i + 3]) for i in range(len(words) - 2))
+    digests = b"".join(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest() for g in grams)
+    hashes = np.frombuffer(digests, dtype="<u8")
+    ones = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).sum(axis=0)
+    return sum(1 << int(i) for i in np.flatnonzero(2 * ones > len(hashes)))
+
+def simhash_bands(sig: int):
+    return [(sig >> (16 * i)) & 0xFFFF for i in range(SIMHASH_BANDS)]
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def _signed64(sig: int) -> int:
+    # SQLite integers are signed
+    return sig - (1 << 64) if sig >= 1 << 63 else sig
+
+class BlockStore:
+    """
+    Long-lived connection to the block hash DB.
+
+    WAL mode lets readers run during writes, lookups fetch a whole page's
+    hashes in one query and updates are one transaction per page.
+    """
+
+    def __init__(self, path=BLOCK_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS blocks (
+                    block_id TEXT PRIMARY KEY,
+                    page_id TEXT,
+                    content_hash TEXT,
+                    last_indexed REAL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS blocks_page ON blocks (page_id)"
+            )
+            # Which HNSW labels (meta rows) a page currently owns, one row
+            # per (label, source block); chunk_hash identifies the text.
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_blocks (
+                    label INTEGER,
+                    block_id TEXT,
+                    page_id TEXT,
+                    chunk_hash TEXT,
+                    PRIMARY KEY (label, block_id)
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chunk_blocks_page ON chunk_blocks (page_id)"
+            )
+            self._migrate_block_chunks()
+            # SimHash of every live HNSW element, with its four bands
+            # indexed so near-duplicates are found without a scan.
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_sigs (
+                    label INTEGER PRIMARY KEY,
+                    sig INTEGER,
+                    b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER
+                )
+            """)
+            for i in range(SIMHASH_BANDS):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS chunk_sigs_b{i} ON chunk_sigs (b{i})"
+                )
+            # Live labels whose row reuses the vector (HNSW element) of a
+            # near-duplicate chunk instead of having their own.
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_vectors (
+                    label INTEGER PRIMARY KEY,
+                    vector INTEGER
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chunk_vectors_vector ON chunk_vectors (vector)"
+            )
+            # Walk frontier of pages whose last crawl stopped early, the
+            # blocks seen so far in that sweep (for deletion detection) and
+            # the labels it created or kept (the rest are older).
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_cursors (
+                    page_id TEXT PRIMARY KEY,
+                    frontier TEXT,
+                    edited REAL,
+                    updated REAL
+                )
+            """)
+            # Pages the bootstrap crawl has fully indexed: one insert per
+            # page, durable as soon as it commits.
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_done (
+                    page_id TEXT PRIMARY KEY,
+                    done_at REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_seen (
+                    page_id TEXT,
+                    block_id TEXT,
+                    PRIMARY KEY (page_id, block_id)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_labels (
+                    page_id TEXT,
+                    label INTEGER,
+                    PRIMARY KEY (page_id, label)
+                )
+            """)
+            # Notion last_edited_time of each page as of its last complete index.
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    page_id TEXT PRIMARY KEY,
+                    last_edited REAL,
+                    last_indexed REAL
+                )
+            """)
+            # Database rows: parent database and whether a walk found a body.
+            cols = {r[1] for r in self._conn.execute("PRAGMA table_info(pages)")}
+            if "database_id" not in cols:
+                self._conn.execute("ALTER TABLE pages ADD COLUMN database_id TEXT")
+            if "has_body" not in cols:
+                self._conn.execute("ALTER TABLE pages ADD COLUMN has_body INTEGER")
+
+    def page_hashes(self, page_id: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT block_id, content_hash FROM blocks WHERE page_id=?",
+                (page_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def _migrate_block_chunks(self):
+        """
+        Move one-block-per-label rows from the old block_chunks table.
+        Their chunk_hash is unknown, so they are replaced on the next edit.
+        """
+        old = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='block_chunks'"
+        ).fetchone()
+        if old is None:
+            return
+        self._conn.execute("""
+            INSERT OR IGNORE INTO chunk_blocks (label, block_id, page_id, chunk_hash)
+            SELECT label, block_id, page_id, NULL FROM block_chunks
+        """)
+        self._conn.execute("DROP TABLE block_chunks")
+
+    def page_chunks(self, page_id: str) -> dict:
+        """
+        {label: (chunk_hash, {block_id, ...})} for every live chunk of a page.
+        """
+        out = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT label, chunk_hash, block_id FROM chunk_blocks WHERE page_id=?",
+                (page_id,)
+            ).fetchall()
+        for label, h, bid in rows:
+            out.setdefault(label, (h, set()))[1].add(bid)
+        return out
+
+    def vector_refs(self, vector) -> int:
+        """
+        Live rows using HNSW element `vector`: its own and its sharers.
+        """
+        with self._lock:
+            (n,) = self._conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM chunk_blocks WHERE label=?) + "
+                "(SELECT COUNT(*) FROM chunk_vectors WHERE vector=?)",
+                (int(vector), int(vector))
+            ).fetchone()
+        return n
+
+    def near_duplicate(self, sig: int, max_distance: int):
+        """
+        Live HNSW element whose SimHash is closest to `sig` within
+        `max_distance` bits, or None.
+        """
+        bands = simhash_bands(sig)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT label, sig FROM chunk_sigs WHERE " +
+                " OR ".join(f"b{i}=?" for i in range(SIMHASH_BANDS)),
+                bands
+            ).fetchall()
+        best = None
+        for label, other in rows:
+            d = hamming(sig, other & 0xFFFFFFFFFFFFFFFF)
+            if d <= max_distance and (best is None or d < best[0]):
+                best = (d, label)
+        return best[1] if best else None
+
+    def crawl_cursor(self, page_id: str):
+        """
+        {"frontier", "edited", "seen", "labels"} of an unfinished sweep, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT frontier, edited FROM crawl_cursors WHERE page_id=?",
+                (page_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            seen = self._conn.execute(
+                "SELECT block_id FROM crawl_seen WHERE page_id=?", (page_id,)
+            ).fetchall()
+            labels = self._conn.execute(
+                "SELECT label FROM crawl_labels WHERE page_id=?", (page_id,)
+            ).fetchall()
+        return {
+            "frontier": json.loads(row[0]),
+            "edited": row[1],
+            "seen": {bid for (bid,) in seen},
+            "labels": {label for (label,) in labels}
+        }
+
+    def save_crawl_cursor(self, page_id: str, frontier, edited, seen, labels=()):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO crawl_cursors (page_id, frontier, edited, updated) "
+                    "VALUES (?, ?, ?, ?)",
+                    (page_id, json.dumps(frontier), edited, time.time())
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO crawl_seen (page_id, block_id) VALUES (?, ?)",
+                    [(page_id, bid) for bid in seen]
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO crawl_labels (page_id, label) VALUES (?, ?)",
+                    [(page_id, int(label)) for label in labels]
+                )
+
+    def clear_crawl_cursor(self, page_id: str):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM crawl_cursors WHERE page_id=?", (page_id,))
+                self._conn.execute("DELETE FROM crawl_seen WHERE page_id=?", (page_id,))
+                self._conn.execute("DELETE FROM crawl_labels WHERE page_id=?", (page_id,))
+
+    def done_pages(self) -> set:
+        with self._lock:
+            rows = self._conn.execute("SELECT page_id FROM crawl_done").fetchall()
+        return {pid for (pid,) in rows}
+
+    def mark_page_done(self, page_id: str):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO crawl_done (page_id, done_at) VALUES (?, ?)",
+                    (page_id, time.time())
+                )
+
+    def import_page_checkpoint(self, path=PAGE_CKPT_PATH):
+        """
+        One-off: move page_checkpoint.json into crawl_done.
+        """
+        if not os.path.exists(path):
+            return
+        done = load_page_checkpoint()
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO crawl_done (page_id, done_at) VALUES (?, ?)",
+                    [(pid, now) for pid in done]
+                )
+        os.replace(path, path + ".imported")
+        print(f"[RAG] imported {len(done)} checkpointed pages")
+
+    def database_body_stats(self) -> dict:
+        """
+        {database_id: [rows walked, rows that had a body]}.
+        """
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT database_id, COUNT(has_body), COALESCE(SUM(has_body), 0)
+                FROM pages WHERE database_id IS NOT NULL GROUP BY database_id
+            """).fetchall()
+        return {db: [walked, bodies] for db, walked, bodies in rows}
+
+    def rows_with_body(self) -> set:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page_id FROM pages WHERE has_body=1"
+            ).fetchall()
+        return {pid for (pid,) in rows}
+
+    def page_edit_times(self) -> dict:
+        """
+        {page_id: last_edited} for every page indexed so far.
+        """
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT page_id, last_edited FROM pages"
+            ).fetchall())
+
+    def has_labels(self) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM chunk_blocks LIMIT 1"
+            ).fetchone() is not None
+
+    def update_page(self, page_id: str, blocks, chunks=(), superseded=(), removed=(),
+                    edited=None, database_id=None, has_body=None, sigs=(), vectors=(),
+                    dead=()):
+        """
+        In a single transaction: record content hashes for changed
+        [(block_id, text)], drop the page's `superseded` labels, register
+        its new [(label, chunk_hash, block_ids)], store [(label, simhash)]
+        of new HNSW elements and [(label, vector)] of new rows sharing
+        one, forget the signatures of `dead` (freed) elements and
+        `removed` block ids entirely and, if given, remember the page's
+        `edited` time (and, for database rows, its database and whether
+        it has a body).
+        """
+        now = time.time()
+        rows = [(bid, page_id, hash_text(text), now) for bid, text in blocks]
+        links = [
+            (int(label), bid, page_id, h)
+            for label, h, bids in chunks for bid in bids
+        ]
+        sig_rows = [
+            (int(label), _signed64(sig), *simhash_bands(sig)) for label, sig in sigs
+        ]
+        if not (rows or links or superseded or removed) and edited is None:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM chunk_blocks WHERE label=? AND page_id=?",
+                    [(int(label), page_id) for label in superseded]
+                )
+                self._conn.executemany(
+                    "DELETE FROM chunk_vectors WHERE label=?",
+                    [(int(label),) for label in superseded]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_vectors (label, vector) VALUES (?, ?)",
+                    [(int(label), int(vector)) for label, vector in vectors]
+                )
+                self._conn.executemany(
+                    "DELETE FROM chunk_sigs WHERE label=?",
+                    [(int(label),) for label in dead]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_sigs (label, sig, b0, b1, b2, b3) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    sig_rows
+                )
+                self._conn.executemany(
+                    "DELETE FROM blocks WHERE block_id=?",
+                    [(bid,) for bid in removed]
+                )
+                self._conn.executemany("""
+                    INSERT OR REPLACE INTO blocks
+                    (block_id, page_id, content_hash, last_indexed)
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_blocks (label, block_id, page_id, chunk_hash) "
+                    "VALUES (?, ?, ?, ?)",
+                    links
+                )
+                if edited is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO pages "
+                        "(page_id, last_edited, last_indexed, database_id, has_body) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (page_id, edited, now, database_id,
+                         None if has_body is None else int(has_body))
+                    )
+
+    def backfill_labels(self, store):
+        """
+        One-off: derive chunk_blocks from the chunk metadata store, whose
+        row numbers are the HNSW labels.
+        """
+        if self.has_labels() or not len(store):
+            return
+        rows = [
+            (int(label), m["block_id"], m["page_id"], hash_text(m["text"]))
+            for label, m in ((l, store.get(l)) for l in store.active_labels())
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_blocks (label, block_id, page_id, chunk_hash) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+        print(f"[RAG] backfilled {len(rows)} chunk labels from metadata")
+
+    def backfill_sigs(self, store):
+        """
+        One-off: SimHash the live chunks of an index built before
+        near-duplicate detection, so new chunks can share their vectors.
+        """
+        if NEAR_DUP_DISTANCE < 0:
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM chunk_sigs LIMIT 1").fetchone():
+                return
+        sigs = []
+        shared = store.shared_rows()
+        for label in store.active_labels():
+            if int(label) in shared:
+                continue
+            sig = simhash(store.text(label))
+            if sig is not None:
+                sigs.append((int(label), _signed64(sig), *simhash_bands(sig)))
+        if not sigs:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_sigs (label, sig, b0, b1, b2, b3) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    sigs
+                )
+        print(f"[RAG] backfilled {len(sigs)} chunk signatures")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+block_store = BlockStore()
 
 # ============================================================
 # NOTION HELPERS
@@ -133,43 +638,8 @@ def notion_time_to_epoch(ts: str) -> float:
     except Exception:
         return 0.0
 
-def all_pages(max_retries=5):
-    pages = {}
-    cursor = None
-
-    while True:
-        for attempt in range(max_retries):
-            try:
-                resp = notion.search(
-                    **({"start_cursor": cursor} if cursor else {}),
-                    filter={"property": "object", "value": "page"}
-                )
-                break
-            except (httpx.RemoteProtocolError, RemoteProtocolError) as e:
-                wait = 2 ** attempt
-                print(f"[RAG][WARN] search connection dropped, retrying in {wait}s")
-                time.sleep(wait)
-            except HTTPResponseError as e:
-                status = getattr(e.response, "status_code", None)
-                if status in (502, 503, 504) and attempt < max_retries - 1:
-                    wait = 2 ** attempt
-                    print(f"[RAG][WARN] Notion {status} on search, retrying in {wait}s")
-                    time.sleep(wait)
-                else:
-                    raise
-        else:
-            raise RuntimeError("[RAG] Notion search failed after retries")
-
-        for p in resp.get("results", []):
-            pages[p["id"]] = p
-
-        if not resp.get("has_more"):
-            break
-
-        cursor = resp.get("next_cursor")
-        time.sleep(0.2)  # gentle pacing
-
-    return list(pages.values())
+def page_edit_time(page) -> float:
+    return notion_time_to_epoch(page.get("last_edited_time") or "")
 
 def plain(rt):
     if rt is None:
@@ -183,82 +653,447 @@ def plain(rt):
         )
     return str(rt)
 
+HEADING_LEVELS = {"heading_1": 1, "heading_2": 2, "heading_3": 3}
+
+def block_text(b):
+    """
+    Indexable text segments of a single Notion block object.
+    """
+    out = []
+    t = b.get("type")
+    if t and isinstance(b.get(t), dict):
+        obj = b[t]
+        if "rich_text" in obj:
+            text = plain(obj["rich_text"])
+            if text.strip():
+                if t in HEADING_LEVELS:
+                    # Markdown-style so the chunker can start sections here.
+                    text = "#" * HEADING_LEVELS[t] + " " + text
+                out.append(text)
+        if "title" in obj:
+            text = plain(obj["title"])
+            if text.strip():
+                out.append(text)
+    return out
+
 # ============================================================
-# SAFE BLOCK FLATTENER (CRITICAL FIX)
+# RATE LIMITER
 # ============================================================
 
-def flatten_blocks(block_id, max_depth=6, max_blocks=500, max_seconds=30):
-    out = []
-    start_time = time.time()
-    visited = 0
+class RateLimiter:
+    """
+    Token bucket shared by every Notion request in the process.
+
+    State is guarded by a threading lock and waiting happens with
+    asyncio.sleep, so one limiter can serve several event loops
+    (bootstrap + daemon) without binding to either of them.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for `seconds` (e.g. a 429 Retry-After).
+        """
+        with self._lock:
+            until = time.monotonic() + float(seconds)
+            if until > self._blocked_until:
+                self._blocked_until = until
+            self._tokens = 0.0
+
+NOTION_LIMITER = RateLimiter(NOTION_RATE_PER_SEC, NOTION_RATE_BURST)
+
+# Statuses that mean the object itself can't be fetched; retrying later
+# is pointless (401 is left out: a bad token fails every request).
+NOTION_PERMANENT_ERRORS = (400, 403, 404)
+_GONE = object()
+
+# ============================================================
+# ASYNC NOTION CRAWLER
+# ============================================================
 
-    def fetch_children(bid, cursor=None, retries=3):
+class NotionCrawler:
+    """
+    Thin async Notion REST client. Every request goes through the shared
+    NOTION_LIMITER, so overall throughput is bounded by the API quota
+    rather than by serial round-trips.
+
+    Use one instance per event loop:
+
+        async with NotionCrawler() as crawler:
+            pages = await crawler.all_pages()
+    """
+
+    def __init__(self, limiter=NOTION_LIMITER, max_in_flight=NOTION_MAX_IN_FLIGHT):
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight
+        self.client = None
+        self._in_flight = None
+        self.api_calls = 0
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            base_url=NOTION_API_BASE,
+            timeout=httpx.Timeout(100.0, connect=15.0),
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight
+            ),
+            headers={
+                "Authorization": f"Bearer {NOTION_TOKEN}",
+                "Notion-Version": NOTION_VERSION,
+                "Content-Type": "application/json"
+            }
+        )
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def request(self, method, path, what, retries=5, gone=None, **kwargs):
+        """
+        Returns the decoded JSON body, or None when the request keeps failing.
+        `gone` is returned instead for errors retrying won't fix (bad
+        request, no access, not found).
+        """
         for attempt in range(retries):
+            await self.limiter.acquire()
             try:
-                return notion.blocks.children.list(block_id=bid, start_cursor=cursor)
-            except HTTPResponseError as e:
-                status = getattr(e.response, "status_code", None)
-                if status in (502, 503, 504) and attempt < retries - 1:
-                    wait = 2 ** attempt
-                    print(f"[RAG][WARN] Notion {status} on {bid}, retrying in {wait}s")
-                    time.sleep(wait)
-                    continue
-                print(f"[RAG][WARN] Notion error {status} on {bid}, skipping block")
-                return None
-            except (APIResponseError, RequestTimeoutError, RemoteProtocolError) as e:
+                async with self._in_flight:
+                    self.api_calls += 1
+                    r = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError:
                 if attempt < retries - 1:
                     wait = 2 ** attempt
-                    print(f"[RAG][WARN] Network error on {bid}, retrying in {wait}s")
-                    time.sleep(wait)
+                    print(f"[RAG][WARN] Network error on {what}, retrying in {wait}s")
+                    await asyncio.sleep(wait)
                     continue
-                print(f"[RAG][WARN] Network failure on {bid}, skipping block")
+                print(f"[RAG][WARN] Network failure on {what}")
                 return None
 
-        return None
+            if r.status_code == 429:
+                try:
+                    wait = float(r.headers.get("Retry-After", "1"))
+                except ValueError:
+                    wait = 1.0
+                print(f"[RAG][WARN] Notion rate limited on {what}, pausing {wait}s")
+                self.limiter.pause(wait)
+                continue
 
-    def walk(bid, depth):
-        nonlocal visited
+            if r.status_code in (502, 503, 504) and attempt < retries - 1:
+                wait = 2 ** attempt
+                print(f"[RAG][WARN] Notion {r.status_code} on {what}, retrying in {wait}s")
+                await asyncio.sleep(wait)
+                continue
 
-        if depth > max_depth:
-            return
-        if time.time() - start_time > max_seconds:
-            print(f"[RAG][WARN] flatten timeout on page {block_id}")
-            return
+            if r.status_code >= 400:
+                print(f"[RAG][WARN] Notion error {r.status_code} on {what}")
+                return gone if r.status_code in NOTION_PERMANENT_ERRORS else None
+
+            return r.json()
+
+        return None
 
+    async def all_pages(self):
+        return await self.pages_edited_since(None)
+
+    async def pages_edited_since(self, since):
+        """
+        Pages ordered by last_edited_time, newest first. With `since`
+        (epoch seconds), stop paging at the first page edited before it.
+        """
+        body = {
+            "filter": {"property": "object", "value": "page"},
+            "sort": {"direction": "descending", "timestamp": "last_edited_time"}
+        }
+        pages = await self._edited_since("/search", body, "search", since)
+        if pages is None:
+            raise RuntimeError("[RAG] Notion search failed after retries")
+        return pages
+
+    async def databases(self):
+        body = {"filter": {"property": "object", "value": "database"}}
+        dbs = await self._edited_since("/search", body, "database search", None)
+        if dbs is None:
+            raise RuntimeError("[RAG] Notion database search failed after retries")
+        return dbs
+
+    async def query_database(self, database_id, since=None):
+        """
+        Rows of a database with their properties, newest edit first, in
+        pages of 100 (databases.query). None if the query keeps failing.
+        """
+        body = {"sorts": [{"timestamp": "last_edited_time", "direction": "descending"}]}
+        return await self._edited_since(
+            f"/databases/{database_id}/query", body, f"database {database_id}", since
+        )
+
+    async def _edited_since(self, path, body, what, since):
+        results = {}
         cursor = None
+
         while True:
-            resp = fetch_children(bid, cursor)
+            req = dict(body, page_size=100)
+            if cursor:
+                req["start_cursor"] = cursor
+
+            resp = await self.request("POST", path, what, json=req)
             if resp is None:
-                return  # skip this branch safely
+                return None
+
+            passed = False
+            for p in resp.get("results", []):
+                if since is not None and page_edit_time(p) < since:
+                    passed = True
+                    break
+                results[p["id"]] = p
+
+            if passed or not resp.get("has_more"):
+                break
+            cursor = resp.get("next_cursor")
+
+        return list(results.values())
+
+    async def list_children(self, block_id, cursor=None):
+        params = {"page_size": 100}
+        if cursor:
+            params["start_cursor"] = cursor
+        return await self.request(
+            "GET", f"/blocks/{block_id}/children", block_id, gone=_GONE, params=params
+        )
 
-            for b in resp.get("results", []):
+    async def flatten_blocks(self, block_id, max_depth=6, max_blocks=500,
+                             max_requests=NOTION_PAGE_MAX_REQUESTS, frontier=None):
+        """
+        Concurrent walk of a page's block tree.
+
+        Sibling subtrees and follow-up cursor pages are fetched as
+        independent tasks; results carry their tree position so the
+        returned [(block_id, text)] list keeps document order.
+
+        Returns (blocks, pending). `pending` is the frontier left when a
+        limit was hit or a branch failed: [block_id, depth, key,
+        start_cursor, page_no, skip] entries that, passed back in as
+        `frontier`, continue the walk where it stopped.
+        """
+        found = []
+        pending = []
+        visited = 0
+        requests = 0
+        stopped = False
+
+        async def walk(bid, depth, key, cursor=None, page_no=0, skip=0):
+            nonlocal visited, requests, stopped
+
+            if depth > max_depth:
+                return
+            if not stopped and requests >= max_requests:
+                print(f"[RAG][WARN] request budget hit on page {block_id}")
+                stopped = True
+            if stopped:
+                pending.append([bid, depth, list(key), cursor, page_no, skip])
+                return
+
+            requests += 1
+            resp = await self.list_children(bid, cursor)
+            if resp is _GONE:
+                # Deleted or inaccessible: nothing to resume, drop the branch.
+                return
+            if resp is None:
+                # Retried from here on the next crawl of this page.
+                pending.append([bid, depth, list(key), cursor, page_no, skip])
+                return
+
+            subtasks = []
+            results = resp.get("results", [])
+            for i in range(skip, len(results)):
+                if visited >= max_blocks:
+                    if not stopped:
+                        print(f"[RAG][WARN] block limit hit on page {block_id}")
+                    stopped = True
+                    # Resuming here also picks up the following cursor pages.
+                    pending.append([bid, depth, list(key), cursor, page_no, i])
+                    break
                 visited += 1
-                if visited > max_blocks:
-                    print(f"[RAG][WARN] block limit hit on page {block_id}")
-                    return
 
-                t = b.get("type")
-                if t and isinstance(b.get(t), dict):
-                    obj = b[t]
-                    if "rich_text" in obj:
-                        text = plain(obj["rich_text"])
-                        if text.strip():
-                            out.append((b["id"], text))
-                    if "title" in obj:
-                        text = plain(obj["title"])
-                        if text.strip():
-                            out.append((b["id"], text))
+                b = results[i]
+                bkey = key + (page_no, i)
+                for text in block_text(b):
+                    found.append((bkey, b["id"], text))
 
                 if b.get("has_children"):
-                    walk(b["id"], depth + 1)
-
-            if not resp.get("has_more"):
-                break
-            cursor = resp["next_cursor"]
-            time.sleep(0.1)
+                    subtasks.append(walk(b["id"], depth + 1, bkey))
+            else:
+                if resp.get("has_more") and resp.get("next_cursor"):
+                    subtasks.append(walk(bid, depth, key, resp["next_cursor"], page_no + 1))
+
+            if subtasks:
+                await asyncio.gather(*subtasks)
+
+        if frontier:
+            await asyncio.gather(*(
+                walk(bid, depth, tuple(key), cursor, page_no, skip)
+                for bid, depth, key, cursor, page_no, skip in frontier
+            ))
+        else:
+            await walk(block_id, 0, ())
+        found.sort(key=lambda x: x[0])
+        pending.sort(key=lambda x: x[2])
+        return [(bid, text) for _, bid, text in found], pending
+
+def all_pages():
+    async def run():
+        async with NotionCrawler() as crawler:
+            return await crawler.all_pages()
+    return asyncio.run(run())
+
+def flatten_blocks(block_id, **limits):
+    async def run():
+        async with NotionCrawler() as crawler:
+            return await crawler.flatten_blocks(block_id, **limits)
+    return asyncio.run(run())
 
-    walk(block_id, 0)
-    return out
+# ============================================================
+# NOTION DATABASES
+# ============================================================
+#
+# Database rows are pages whose content is mostly in their properties.
+# They are listed in bulk with databases.query and indexed from their
+# properties as one pseudo-block (keyed by the row id). Rows have no
+# has_children flag, so a body walk is only spent on rows known to have
+# a body, or while a database's rows are still being sampled.
+
+def database_id(page):
+    parent = page.get("parent") or {}
+    return parent.get("database_id") if parent.get("type") == "database_id" else None
+
+def property_text(prop) -> str:
+    t = prop.get("type")
+    v = prop.get(t)
+    if t in ("title", "rich_text"):
+        return plain(v)
+    if t in ("select", "status"):
+        return (v or {}).get("name", "")
+    if t == "multi_select":
+        return ", ".join(o.get("name", "") for o in v or [])
+    if t == "date":
+        if not v:
+            return ""
+        return v.get("start", "") + (f" → {v['end']}" if v.get("end") else "")
+    return ""
+
+def row_text(row) -> str:
+    """
+    "# Title" followed by one "Name: value" line per non-empty property.
+    """
+    title, lines = "", []
+    for name, prop in (row.get("properties") or {}).items():
+        text = property_text(prop).strip()
+        if not text:
+            continue
+        if prop.get("type") == "title":
+            title = text
+        else:
+            lines.append(f"{name}: {text}")
+    if title:
+        lines.insert(0, f"# {title}")
+    return "\n".join(lines)
+
+class RowBodyPolicy:
+    """
+    Whether a changed database row needs a block walk: always for rows
+    known to have a body, otherwise only until NOTION_DB_BODY_SAMPLE rows
+    of its database were walked without finding any, or when an indexed
+    row was edited but its property text is unchanged (the edit must be
+    in a body added since).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.stats = store.database_body_stats()
+        self.bodies = store.rows_with_body()
+
+    def should_walk(self, row, text=""):
+        """
+        Counts the walk against the database's sample when it says yes.
+        """
+        if row["id"] in self.bodies:
+            return True
+        st = self.stats.setdefault(database_id(row), [0, 0])
+        if st[1] > 0 or st[0] < NOTION_DB_BODY_SAMPLE:
+            st[0] += 1
+            return True
+        # Only rows whose last_edited_time moved get here.
+        known = self.store.page_hashes(row["id"])
+        return bool(known) and known.get(row["id"]) == (hash_text(text) if text else None)
+
+    def record(self, row, has_body):
+        if has_body:
+            self.stats.setdefault(database_id(row), [1, 0])[1] += 1
+            self.bodies.add(row["id"])
+
+async def crawl_row(crawler, row, policy, frontier=None):
+    """
+    (blocks, pending, has_body) for a database row; has_body is None when
+    the body was not walked.
+    """
+    blocks = []
+    text = row_text(row)
+    if text:
+        blocks.append((row["id"], text))
+
+    if frontier is None and not policy.should_walk(row, text):
+        return blocks, [], None
+
+    body, pending = await crawler.flatten_blocks(row["id"], frontier=frontier)
+    if frontier is None:
+        policy.record(row, bool(body))
+    return blocks + body, pending, bool(body) or frontier is not None
+
+async def with_database_rows(crawler, pages, databases, since=None):
+    """
+    Replace database rows found by page search with their databases.query
+    versions, which also covers rows search did not return.
+    """
+    by_id = {p["id"]: p for p in pages}
+    for db in databases:
+        rows = await crawler.query_database(db, since)
+        if rows is None:
+            print(f"[RAG][WARN] query of database {db} failed; using search results")
+            continue
+        by_id.update((r["id"], r) for r in rows)
+    return list(by_id.values())
 
 # ============================================================
 # CHUNKING
@@ -276,147 +1111,1159 @@ def chunk_words(text, size=450, overlap=60):
         start = max(0, end - overlap)
     return chunks
 
+HEADING_RE = re.compile(r"^#{1,3} ")
+
+def chunk_page(blocks, target_tokens=CHUNK_TARGET_TOKENS):
+    """
+    Pack consecutive [(block_id, text)] of a page into chunks of about
+    `target_tokens`. A heading starts a new chunk; a block too long on its
+    own is split with chunk_words. Returns [(text, [block_id, ...])].
+    """
+    max_words = max(1, target_tokens * 3 // 4)
+    out = []
+    parts, bids, size, only_headings = [], [], 0, True
+
+    def flush():
+        nonlocal parts, bids, size, only_headings
+        if parts:
+            out.append(("\n".join(parts), bids))
+        parts, bids, size, only_headings = [], [], 0, True
+
+    for bid, text in blocks:
+        words = len(text.split())
+        if not words:
+            continue
+        heading = bool(HEADING_RE.match(text))
+
+        if words > max_words:
+            flush()
+            for piece in chunk_words(text, size=max_words, overlap=max_words // 8):
+                out.append((piece, [bid]))
+            continue
+
+        if parts and ((heading and not only_headings) or size + words > max_words):
+            flush()
+        parts.append(text)
+        if bid not in bids:
+            bids.append(bid)
+        size += words
+        only_headings = only_headings and heading
+
+    flush()
+    return out
+
 # ============================================================
 # EMBEDDING
 # ============================================================
 
-def embed_with_ollama(text, retries=3):
+def embed_batch_with_ollama(texts, retries=3):
+    """
+    One /api/embed call for a list of prompts. Raises after `retries`.
+    """
     for i in range(retries):
         try:
-            r = ollama_client.embeddings(
+            r = ollama_client.embed(
                 model=OLLAMA_EMBED_MODEL,
-                prompt=f"search_document: {text}"
+                input=list(texts)
             )
-            return r["embedding"]
+            embs = r["embeddings"]
+            if len(embs) != len(texts):
+                raise RuntimeError(f"expected {len(texts)} embeddings, got {len(embs)}")
+            return embs
         except Exception:
+            if i == retries - 1:
+                raise
             time.sleep(2 ** i)
-    return None
+
+class AdaptiveBatchSize:
+    """
+    Halves the embedding batch on failure and doubles it again after
+    `grow_after` consecutive successes, bounded by [1, maximum].
+    """
+
+    def __init__(self, initial=OLLAMA_EMBED_BATCH, maximum=OLLAMA_EMBED_MAX_BATCH, grow_after=8):
+        self.maximum = max(1, maximum)
+        self.size = max(1, min(initial, self.maximum))
+        self.grow_after = grow_after
+        self._streak = 0
+
+    def success(self):
+        self._streak += 1
+        if self._streak >= self.grow_after:
+            self.size = min(self.maximum, self.size * 2)
+            self._streak = 0
+
+    def failure(self):
+        self.size = max(1, self.size // 2)
+        self._streak = 0
+
+_batch_size = AdaptiveBatchSize()
+
+def embed_prompts(prompts):
+    """
+    Embed `prompts` in adaptive batches straight into a float32 matrix.
+    Raises RuntimeError if a prompt cannot be embedded even on its own.
+    """
+    n = len(prompts)
+    out = None
+    pos = 0
+
+    with tqdm(total=n, desc="Embedding chunks", unit="chunk") as bar:
+        while pos < n:
+            size = _batch_size.size
+            batch = prompts[pos:pos + size]
+            try:
+                embs = embed_batch_with_ollama(batch, retries=1 if size > 1 else 3)
+            except Exception as e:
+                if size == 1:
+                    raise RuntimeError(f"embedding failed: {e}")
+                _batch_size.failure()
+                print(f"[RAG][WARN] embed batch of {size} failed, shrinking to {_batch_size.size}")
+                continue
+
+            if out is None:
+                out = np.empty((n, len(embs[0])), dtype="float32")
+            out[pos:pos + len(batch)] = embs
+
+            pos += len(batch)
+            bar.update(len(batch))
+            _batch_size.success()
+
+    if out is None:
+        return np.empty((0, 0), dtype="float32")
+    return out
 
 def embed_chunks(chunks):
-    vecs = []
-    for ch in tqdm(chunks, desc="Embedding chunks", unit="chunk"):
-        emb = embed_with_ollama(ch)
-        if emb is not None:
-            vecs.append(emb)
-    return np.asarray(vecs, dtype="float32")
+    """
+    Embed document chunks, consulting the persistent embedding cache first.
+    Only text never seen before with OLLAMA_EMBED_MODEL reaches Ollama.
+    """
+    prompts = [DOC_PREFIX + ch for ch in chunks]
+    cached = embed_cache.get_many(OLLAMA_EMBED_MODEL, prompts)
+
+    missing = {}
+    for i, (p, v) in enumerate(zip(prompts, cached)):
+        if v is None:
+            missing.setdefault(p, []).append(i)
+
+    if missing:
+        print(f"   ↳ embedding cache: {len(prompts) - sum(map(len, missing.values()))} hits, "
+              f"{len(missing)} to embed")
+        todo = list(missing)
+        fresh = embed_prompts(todo)
+        embed_cache.put_many(OLLAMA_EMBED_MODEL, todo, fresh)
+        dim = fresh.shape[1]
+    else:
+        fresh = None
+        dim = len(cached[0]) if cached else 0
+
+    out = np.empty((len(prompts), dim), dtype="float32")
+    for i, v in enumerate(cached):
+        if v is not None:
+            out[i] = v
+    if fresh is not None:
+        for j, p in enumerate(todo):
+            out[missing[p]] = fresh[j]
+    return out
 
 # ============================================================
 # HNSW
 # ============================================================
 
+def index_file_header(path):
+    """
+    Fixed header of a saved hnswlib index: (offsetLevel0, max_elements,
+    cur_element_count, size_data_per_element, label_offset, offsetData).
+    """
+    with open(path, "rb") as f:
+        return struct.unpack("<6Q", f.read(48))
+
+def index_file_dim(path):
+    """
+    Vector dimension of a saved hnswlib index, read from its header
+    (float32 data sits between offsetData and label_offset).
+    """
+    _, _, _, _, label_offset, offset_data = index_file_header(path)
+    return (label_offset - offset_data) // 4
+
+def stored_index_dim(path=HNSW_INDEX_PATH):
+    manifest = read_manifest(path)
+    if manifest:
+        return manifest["dim"]
+    return index_file_dim(path)  # index predates the manifest
+
+def budget_capacity(dim):
+    """
+    Most slots HNSW_MEMORY_BUDGET_MB allows, or None without a budget.
+    """
+    if HNSW_MEMORY_BUDGET_MB <= 0:
+        return None
+    return int(HNSW_MEMORY_BUDGET_MB * 2**20 // hnsw_element_bytes(dim, HNSW_M))
+
+def initial_capacity(dim, count=0):
+    cap = max(HNSW_INITIAL_CAPACITY, int(math.ceil(count * HNSW_GROWTH_FACTOR)))
+    limit = budget_capacity(dim)
+    return max(count, min(cap, limit)) if limit else cap
+
+def ensure_capacity(index, needed):
+    """
+    Grow `index` to hold `needed` slots, by at least HNSW_GROWTH_FACTOR,
+    within the memory budget.
+    """
+    cap = index.get_max_elements()
+    if needed <= cap:
+        return
+    new = max(needed, int(math.ceil(cap * HNSW_GROWTH_FACTOR)))
+    limit = budget_capacity(index.dim)
+    if limit is not None:
+        if needed > limit:
+            raise RuntimeError(
+                f"[RAG] HNSW needs {needed} slots but HNSW_MEMORY_BUDGET_MB="
+                f"{HNSW_MEMORY_BUDGET_MB:g} allows {limit}"
+            )
+        new = min(new, limit)
+    print(f"[RAG] growing HNSW capacity {cap} → {new}")
+    index.resize_index(new)
+
 def load_or_create_index(dim):
+    manifest = read_manifest(HNSW_INDEX_PATH)
+    if manifest and manifest.get("embed_model") != OLLAMA_EMBED_MODEL:
+        raise RuntimeError(
+            f"[RAG] index was built with {manifest.get('embed_model')}, "
+            f"not {OLLAMA_EMBED_MODEL}; delete {ARTIFACTS_DIR}/ to rebuild"
+        )
+    if manifest and manifest.get("dim") != dim:
+        raise RuntimeError(f"[RAG] index dim {manifest.get('dim')} != embedding dim {dim}")
+
+    # allow_replace_deleted lets new chunks reuse slots of tombstoned ones.
     if os.path.exists(HNSW_INDEX_PATH):
-        idx = hnswlib.Index(space="cosine", dim=dim)
-        idx.load_index(HNSW_INDEX_PATH)
-        idx.set_ef(256)
+        # Reserve for what is stored plus headroom, which also shrinks
+        # indexes saved with the old fixed 1M capacity.
+        count = index_file_header(HNSW_INDEX_PATH)[2]
+        idx = hnswlib.Index(space=HNSW_SPACE, dim=dim)
+        idx.load_index(
+            HNSW_INDEX_PATH, max_elements=initial_capacity(dim, count),
+            allow_replace_deleted=True
+        )
+        idx.set_ef(HNSW_EF)
         return idx
-    idx = hnswlib.Index(space="cosine", dim=dim)
-    idx.init_index(max_elements=1_000_000, ef_construction=200, M=32)
-    idx.set_ef(256)
+    idx = hnswlib.Index(space=HNSW_SPACE, dim=dim)
+    idx.init_index(
+        max_elements=initial_capacity(dim), ef_construction=HNSW_EF_CONSTRUCTION,
+        M=HNSW_M, allow_replace_deleted=True
+    )
+    idx.set_ef(HNSW_EF)
     return idx
 
+class IndexWriter:
+    """
+    Keeps one hnswlib.Index open for a whole bootstrap / daemon run.
+
+    Vectors are added in memory (multi-threaded) and the index is saved
+    every HNSW_CHECKPOINT_SECONDS or HNSW_CHECKPOINT_ITEMS, and on close().
+    Metadata rows, tombstones and `on_commit` callbacks (block hashes,
+    page checkpoints) are held back until the checkpoint that makes
+    their vectors durable, so a crash never records work that was lost.
+
+    Labels are chunk store row numbers and only ever grow; HNSW slots of
+    freed elements are reused by later inserts. Rows of near-duplicate
+    chunks have no element of their own and point at another row's.
+
+    The float32 graph stays resident even with VECTOR_QUANT, which only
+    shrinks the search process; HNSW_MEMORY_BUDGET_MB bounds it here.
+    """
+
+    def __init__(
+        self,
+        path=HNSW_INDEX_PATH,
+        checkpoint_seconds=HNSW_CHECKPOINT_SECONDS,
+        checkpoint_items=HNSW_CHECKPOINT_ITEMS,
+        num_threads=HNSW_ADD_THREADS
+    ):
+        self.path = path
+        self.checkpoint_seconds = checkpoint_seconds
+        self.checkpoint_items = checkpoint_items
+        self.num_threads = num_threads
+        self.index = None
+        self.vectors = None
+        self.next_label = len(chunk_store)
+        self.version = (read_manifest(path) or {}).get("version", 0)
+        self._lock = threading.RLock()
+        self._pending_meta = []
+        self._pending_tombstones = []
+        self._pending_commits = []
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.time()
+        self._free_slots = 0
+
+    def _ensure_index(self, dim):
+        if self.index is not None:
+            return
+        self.index = load_or_create_index(dim)
+        self.vectors = VectorStore(ARTIFACTS_DIR, dim, VECTOR_QUANT, writable=True)
+        self._reconcile()
+        self._backfill_vectors()
+        self._free_slots = self._count_free_slots()
+
+    def _count_free_slots(self):
+        """
+        Slots of deleted elements, which add_items(replace_deleted=True)
+        fills before taking new ones. hnswlib doesn't report them, so
+        count the stored ids that are neither active chunks nor shared by
+        active ones.
+        """
+        used = self.index.get_current_count()
+        if not used:
+            return 0
+        flags = chunk_store.active_flags()
+        ids = np.asarray(self.index.get_ids_list(), dtype="int64")
+        ids = ids[ids < len(flags)]
+        held = {v for l, v in chunk_store.shared_rows().items() if flags[l] and not flags[v]}
+        return used - int((flags[ids] == 1).sum()) - len(held)
+
+    def _reconcile(self):
+        """
+        Metadata is appended before the index is saved, so after a crash
+        either side can be ahead. Hide rows without vectors and vectors
+        without rows.
+        """
+        n = len(chunk_store)
+        ids = self.index.get_ids_list() if self.index.get_current_count() else []
+        top = int(max(ids)) if len(ids) else -1
+
+        orphans = [int(l) for l in ids if l >= n]
+        for label in orphans:
+            try:
+                self.index.mark_deleted(label)
+            except RuntimeError:
+                pass
+
+        # Shared rows have no element of their own; they're only missing
+        # if the element they point at is.
+        missing = [l for l in range(top + 1, n) if chunk_store.vector_of(l) > top]
+        if orphans or missing:
+            print(f"[RAG][WARN] reconciling index/metadata: "
+                  f"{len(orphans)} orphan vectors, {len(missing)} rows without vectors")
+            chunk_store.set_active(missing, False)
+
+    def _backfill_vectors(self):
+        """
+        One-off: copy vectors of an index built before vectors.f32 existed.
+        """
+        if len(self.vectors) >= self.next_label or not self.index.get_current_count():
+            return
+        flags = chunk_store.active_flags()
+        ids = np.asarray(self.index.get_ids_list(), dtype="int64")
+        ids = ids[ids < len(flags)]
+        ids = np.sort(ids[flags[ids] == 1])
+        print(f"[RAG] backfilling {len(ids)} vectors into vectors.f32")
+
+        block = VectorStore.SCAN_BLOCK
+        for start in range(len(self.vectors), self.next_label, block):
+            end = min(self.next_label, start + block)
+            rows = np.zeros((end - start, self.index.dim), dtype="float32")
+            part = ids[(ids >= start) & (ids < end)]
+            if len(part):
+                rows[part - start] = self.index.get_items(part)
+            self.vectors.write(start, rows)
+
+    def add(self, vecs, metas, on_commit=None, shared=()):
+        """
+        Insert vectors, returning their labels followed by those of the
+        `shared` rows (metas whose `vector_of` names the element they
+        reuse; they add no element). `on_commit(labels)` runs after the
+        checkpoint that persists them.
+        """
+        with self._lock:
+            n = len(metas)
+            if n:
+                self._ensure_index(vecs.shape[1])
+            elif self.index is None:
+                self._ensure_index(stored_index_dim(self.path))
+            # next_label only moves once nothing can fail, so labels keep
+            # matching chunk store rows.
+            labels = np.arange(self.next_label, self.next_label + n + len(shared))
+
+            copies = None
+            if shared:
+                copies = self.index.get_items([m["vector_of"] for m in shared])
+            if n:
+                reused = self._make_room(n)
+                self.index.add_items(
+                    vecs, labels[:n], num_threads=self.num_threads, replace_deleted=True
+                )
+                self._free_slots -= reused
+                self.vectors.write(int(labels[0]), vecs)
+            if shared:
+                # vectors.f32 still gets a row per label for the compressed scan.
+                self.vectors.write(int(labels[n]), np.asarray(copies, dtype="float32"))
+            self.next_label += len(labels)
+
+            self._pending_meta.extend(metas)
+            self._pending_meta.extend(shared)
+            if on_commit is not None:
+                self._pending_commits.append((on_commit, labels))
+            self._since_checkpoint += len(labels)
+
+            self.maybe_checkpoint()
+            return labels
+
+    def _make_room(self, n, freeing=0):
+        # Freed slots are reused first; returns how many `n` takes.
+        reused = min(self._free_slots + freeing, n)
+        ensure_capacity(self.index, self.index.get_current_count() + n - reused)
+        return min(self._free_slots, n)
+
+    def make_room(self, dim, n, freeing=0):
+        """
+        Grow the index for `n` new vectors, counting `freeing` slots about
+        to be tombstoned; raises past the memory budget, before anything
+        is tombstoned or added.
+        """
+        if not n:
+            return
+        with self._lock:
+            self._ensure_index(dim)
+            self._make_room(n, freeing)
+
+    def tombstone(self, labels, elements=None):
+        """
+        Hide superseded chunks from search and free the HNSW slots of
+        `elements` (by default the chunks' own).
+        """
+        elements = labels if elements is None else elements
+        if not (labels or elements):
+            return
+        with self._lock:
+            if self.index is None:
+                if not os.path.exists(self.path):
+                    return
+                self._ensure_index(stored_index_dim(self.path))
+            for label in elements:
+                try:
+                    self.index.mark_deleted(int(label))
+                except RuntimeError:
+                    continue  # already deleted or never persisted
+                self._free_slots += 1
+            self._pending_tombstones.extend(int(l) for l in labels)
+            self._since_checkpoint += len(labels)
+
+    def after_commit(self, fn):
+        """
+        Run `fn([])` once everything added so far is durable.
+        """
+        with self._lock:
+            if self._since_checkpoint == 0:
+                fn([])
+            else:
+                self._pending_commits.append((fn, []))
+
+    def maybe_checkpoint(self):
+        with self._lock:
+            if self._since_checkpoint == 0:
+                return
+            if (
+                self._since_checkpoint >= self.checkpoint_items
+                or time.time() - self._last_checkpoint >= self.checkpoint_seconds
+            ):
+                self.checkpoint()
+
+    def checkpoint(self):
+        with self._lock:
+            self._last_checkpoint = time.time()
+            if self._since_checkpoint == 0:
+                return
+
+            first = chunk_store.append(self._pending_meta)
+            chunk_store.set_active(self._pending_tombstones, False)
+            if self._pending_meta:
+                lexical_index.add(first, [m["text"] for m in self._pending_meta])
+            lexical_index.remove(self._pending_tombstones)
+
+            tmp = self.path + ".tmp"
+            self.index.save_index(tmp)
+            os.replace(tmp, self.path)
+
+            self.version += 1
+            manifest = self.manifest()
+            write_manifest(self.path, manifest)
+            self.publish(manifest)
+
+            commits = self._pending_commits
+            cap = self.capacity()
+            print(f"[RAG] checkpoint: {len(self._pending_meta)} added, "
+                  f"{len(self._pending_tombstones)} tombstoned, "
+                  f"{self.next_label} labels, "
+                  f"{cap['used']}/{cap['capacity']} HNSW slots ({cap['reserved_mb']:.1f} MB)")
+
+            self._pending_meta = []
+            self._pending_tombstones = []
+            self._pending_commits = []
+            self._since_checkpoint = 0
+
+            for fn, labels in commits:
+                fn(labels)
+
+    def publish(self, manifest):
+        """
+        Expose the just-saved state to search processes as a new snapshot.
+        """
+        link, copy = ChunkStore.snapshot_files()
+        vlink, vcopy = VectorStore.snapshot_files()
+        publish_snapshot(
+            ARTIFACTS_DIR, self.version, self.path, manifest,
+            link=link + vlink, copy=copy + vcopy, keep=SNAPSHOT_KEEP
+        )
+
+    def manifest(self):
+        # A tuned ef (bench_ef.py --write) outlives the constant.
+        prev = read_manifest(self.path) or {}
+        tuning = prev.get("ef_tuning")
+        out = {
+            "embed_model": OLLAMA_EMBED_MODEL,
+            "dim": self.index.dim,
+            "space": HNSW_SPACE,
+            "M": HNSW_M,
+            "ef_construction": HNSW_EF_CONSTRUCTION,
+            "ef": prev.get("ef", HNSW_EF) if tuning else HNSW_EF,
+            "vector_quant": VECTOR_QUANT,
+            "count": len(chunk_store.active_labels()),
+            "labels": self.next_label,
+            "capacity": self.index.get_max_elements(),
+            "version": self.version,
+            "updated_at": time.time()
+        }
+        if tuning:
+            out["ef_tuning"] = tuning
+        return out
+
+    def capacity(self):
+        """
+        Reserved HNSW slots vs. used ones, and what they cost.
+        """
+        with self._lock:
+            if self.index is None:
+                return None
+            per = hnsw_element_bytes(self.index.dim, HNSW_M)
+            cap = self.index.get_max_elements()
+            used = self.index.get_current_count()
+            return {
+                "capacity": cap,
+                "used": used,
+                "utilization": used / cap if cap else 0.0,
+                "element_bytes": per,
+                "reserved_mb": cap * per / 2**20,
+                "budget_mb": HNSW_MEMORY_BUDGET_MB or None,
+            }
+
+    def close(self):
+        self.checkpoint()
+
+index_writer = IndexWriter()
+
 # ============================================================
 # INDEXING
 # ============================================================
 
-def incremental_index_page(page):
-    print("   ↳ flattening")
-    blocks = flatten_blocks(page["id"])
-
-    if not blocks:
-        print("   ↳ no blocks")
-        return
-
-    print(f"   ↳ blocks: {len(blocks)}")
-
-    new_chunks = []
-    new_meta = []
-
-    print("   ↳ chunking")
-    for block_id, text in blocks:
-        if not block_changed(block_id, text):
-            continue
-
-        chunks = chunk_words(text)
-        for ch in chunks:
-            new_chunks.append(ch)
-            new_meta.append({
-                "page_id": page["id"],
-                "url": page.get("url", ""),
-                "block_id": block_id,
-                "text": ch,
-                "created_at": time.time(),
-                "active": True
-            })
-
-        update_block(block_id, page["id"], text)
-
-    if not new_chunks:
-        print("   ↳ no new chunks")
-        return
-
-    print(f"   ↳ embedding {len(new_chunks)} chunks")
-    vecs = embed_chunks(new_chunks)
-
-    print("   ↳ updating index")
-    idx = load_or_create_index(vecs.shape[1])
-    start = idx.get_current_count()
-    ids = np.arange(start, start + vecs.shape[0])
-    idx.add_items(vecs, ids)
-    idx.save_index(HNSW_INDEX_PATH)
+class PagePlan:
+    """
+    What re-indexing one crawled page involves: the chunks to embed (with
+    their metadata, source blocks and SimHash), near-duplicate chunks that
+    get their own row but reuse a live vector, the blocks whose hashes
+    change, and the labels the page stops referencing.
+    """
+
+    def __init__(self, page, complete):
+        self.page = page
+        self.complete = complete
+        self.edited = page_edit_time(page)
+        self.seen = set()
+        self.frontier = None
+        self.resumed = False
+        self.has_body = None
+        self.changed_blocks = []
+        self.chunk_blocks = []
+        self.chunks = []
+        self.metas = []
+        self.sigs = []
+        self.shared = []
+        self.kept = set()
+        self.removed = []
+        self.superseded = []
+
+    def meta(self, text, bids):
+        return {
+            "page_id": self.page["id"],
+            "url": self.page.get("url", ""),
+            "block_id": bids[0],
+            "text": text,
+            "created_at": time.time(),
+            "active": True
+        }
+
+    def add_chunk(self, text, bids, sig):
+        self.chunks.append(text)
+        self.chunk_blocks.append(bids)
+        self.sigs.append(sig)
+        self.metas.append(self.meta(text, bids))
+
+    def share_chunk(self, i, vector):
+        """
+        Make new chunk `i` reuse the live HNSW element `vector`.
+        """
+        self.shared.append((vector, self.chunks[i], self.chunk_blocks[i]))
+        for field in (self.chunks, self.chunk_blocks, self.sigs, self.metas):
+            del field[i]
+
+    def shared_metas(self):
+        return [
+            dict(self.meta(text, bids), vector_of=int(vector))
+            for vector, text, bids in self.shared
+        ]
+
+class NearDuplicates:
+    """
+    The writer's view of shared HNSW elements ahead of the block DB:
+    signatures of elements added since the last checkpoint, rows using
+    an element that pages applied but not committed yet have added or
+    dropped, and elements freed this run (plans made earlier may still
+    point at them). Only the writer (apply_page and its commits) touches
+    it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.sigs = {}
+        self.bands = [{} for _ in range(SIMHASH_BANDS)]
+        self.pending = set()
+        self.refs = {}
+        self.dead = set()
+
+    def find(self, sig):
+        """
+        Uncommitted element near `sig` (the plan stage already checked the DB).
+        """
+        best = None
+        for i, band in enumerate(simhash_bands(sig)):
+            for label in self.bands[i].get(band, ()):
+                d = hamming(sig, self.sigs[label])
+                if d <= NEAR_DUP_DISTANCE and (best is None or d < best[0]):
+                    best = (d, label)
+        return best[1] if best else None
+
+    def _count(self, vectors, n):
+        for v in vectors:
+            refs = self.refs.get(v, 0) + n
+            if refs:
+                self.refs[v] = refs
+            else:
+                self.refs.pop(v, None)
+
+    def add_pending(self, labels, sigs):
+        self.pending.update(labels)
+        self._count(labels, 1)
+        for label, sig in zip(labels, sigs):
+            if sig is None:
+                continue
+            self.sigs[label] = sig
+            for i, band in enumerate(simhash_bands(sig)):
+                self.bands[i].setdefault(band, set()).add(label)
+
+    def _drop_pending(self, label):
+        sig = self.sigs.pop(label, None)
+        if sig is not None:
+            for i, band in enumerate(simhash_bands(sig)):
+                self.bands[i][band].discard(label)
+                if not self.bands[i][band]:
+                    del self.bands[i][band]
+
+    def freed_by(self, shared, released):
+        """
+        Elements no row would use any more once rows are added on
+        `shared` elements and dropped from `released` ones.
+        """
+        delta = Counter(shared)
+        delta.subtract(released)
+        return [
+            v for v in dict.fromkeys(released)
+            if self.store.vector_refs(v) + self.refs.get(v, 0) + delta[v] <= 0
+        ]
+
+    def apply(self, shared, released, dead):
+        """
+        Count rows added on `shared` elements and rows dropped from
+        `released` ones, `dead` being what freed_by() returned.
+        """
+        self._count(shared, 1)
+        self._count(released, -1)
+        for v in dead:
+            self.dead.add(v)
+            self._drop_pending(v)
+        return dead
+
+    def commit(self, labels, shared, released):
+        """
+        The block DB now records what apply() counted.
+        """
+        own = [int(l) for l in labels if int(l) in self.pending]
+        self.pending.difference_update(own)
+        self._count(own, -1)
+        for label in own:
+            self._drop_pending(label)
+        self._count(shared, -1)
+        self._count(released, 1)
+
+near_dups = NearDuplicates(block_store)
+
+def plan_page(page, blocks, complete=True, frontier=None, cursor=None, has_body=None) -> PagePlan:
+    """
+    If any block of the page changed or disappeared, re-pack the page with
+    chunk_page. Chunks identical to a live one (same text, same blocks)
+    keep their label; the rest are embedded, and live chunks that no
+    longer occur are superseded.
+
+    `cursor` is the stored state of a sweep this crawl continued and
+    `frontier` where the crawl stopped, if it did. Each segment of such a
+    sweep is re-packed, so that chunks from before the sweep, even ones
+    spanning segments, are superseded once it has seen all their blocks.
+    """
+    pid = page["id"]
+    stored = block_store.page_hashes(pid)
+    plan = PagePlan(page, complete)
+    plan.seen = {bid for bid, _ in blocks}
+    plan.frontier = frontier or None
+    plan.has_body = has_body
+    if cursor is not None:
+        # A sweep finishes with the edit time it started from, so edits
+        # made meanwhile trigger a fresh sweep.
+        plan.resumed = True
+        plan.edited = cursor["edited"]
+
+    plan.changed_blocks = [
+        (bid, text) for bid, text in blocks if stored.get(bid) != hash_text(text)
+    ]
+    # Only trust "block is gone" when the whole page was walked.
+    seen = plan.seen | (cursor["seen"] if cursor else set())
+    plan.removed = [bid for bid in stored if bid not in seen] if complete else []
+    sweep = plan.frontier is not None or cursor is not None
+    if not plan.changed_blocks and not plan.removed and not sweep:
+        return plan
+
+    owned = block_store.page_chunks(pid)
+    live = {(h, frozenset(bids)): label for label, (h, bids) in owned.items()}
+    kept = set()
+    fresh = []
+
+    for text, bids in chunk_page(blocks):
+        label = live.pop((hash_text(text), frozenset(bids)), None)
+        if label is not None:
+            kept.add(label)
+        else:
+            fresh.append((text, bids))
+
+    plan.kept = kept
+
+    # A partial walk (or one segment of a resumed sweep) only speaks for
+    # chunks made entirely of blocks it saw, or of blocks now gone; older
+    # chunks than the sweep also go once it has seen all their blocks.
+    whole_page = complete and cursor is None
+    removed = set(plan.removed)
+    swept = cursor["labels"] if cursor else set()
+    plan.superseded = [
+        label for label, (_, bids) in owned.items()
+        if label not in kept and (
+            whole_page or bids <= plan.seen or bids & removed
+            or (sweep and label not in swept and bids <= seen)
+        )
+    ]
+
+    # Near-duplicates of committed chunks reuse their vector unembedded.
+    for text, bids in fresh:
+        sig = simhash(text)
+        vector = None
+        if sig is not None:
+            vector = block_store.near_duplicate(sig, NEAR_DUP_DISTANCE)
+        if vector is None:
+            plan.add_chunk(text, bids, sig)
+        else:
+            plan.shared.append((vector, text, bids))
+    return plan
+
+def apply_page(plan: PagePlan, vecs, on_commit=None):
+    """
+    Add the new chunks and drop the page's superseded ones; an HNSW
+    element is freed once no row uses it any more. Block hashes, chunk
+    references and the page edit time are only recorded once the rows
+    are checkpointed.
+    """
+    page = plan.page
+    pid = page["id"]
+    dups = near_dups
+
+    # Shares found while planning may point at elements freed since.
+    lost = [s for s in plan.shared if s[0] in dups.dead]
+    if lost:
+        plan.shared = [s for s in plan.shared if s[0] not in dups.dead]
+        for _, text, bids in lost:
+            plan.add_chunk(text, bids, simhash(text))
+        extra = embed_chunks([text for _, text, _ in lost])
+        vecs = extra if vecs is None else np.vstack([vecs, extra])
+
+    # New chunks that near-duplicate ones added earlier in this run.
+    keep = np.ones(len(plan.chunks), dtype=bool)
+    for i in reversed(range(len(plan.chunks))):
+        sig = plan.sigs[i]
+        vector = dups.find(sig) if sig is not None else None
+        if vector is not None:
+            plan.share_chunk(i, vector)
+            keep[i] = False
+    if vecs is not None:
+        vecs = vecs[keep]
+
+    shared = [vector for vector, _, _ in plan.shared]
+    released = [chunk_store.vector_of(l) for l in plan.superseded]
+    dead = dups.freed_by(shared, released)
+    # Over budget: fail before the superseded chunks are tombstoned, so
+    # the page stays searchable until a retry fits.
+    if plan.chunks:
+        index_writer.make_room(vecs.shape[1], len(plan.chunks), freeing=len(dead))
+    dups.apply(shared, released, dead)
+    committed = False
+
+    def commit(labels):
+        nonlocal committed
+        committed = True
+        own, rest = labels[:len(plan.chunks)], labels[len(plan.chunks):]
+        block_store.update_page(
+            pid, plan.changed_blocks,
+            chunks=[
+                (label, hash_text(text), bids)
+                for label, text, bids in zip(own, plan.chunks, plan.chunk_blocks)
+            ] + [
+                (label, hash_text(text), bids)
+                for label, (_, text, bids) in zip(rest, plan.shared)
+            ],
+            superseded=plan.superseded,
+            removed=plan.removed,
+            # An unfinished sweep must continue, so don't mark the page current.
+            edited=plan.edited if plan.complete else None,
+            database_id=database_id(page),
+            has_body=plan.has_body,
+            sigs=[(l, s) for l, s in zip(own, plan.sigs) if s is not None],
+            vectors=list(zip(rest, shared)),
+            dead=dead
+        )
+        dups.commit(own, shared, released)
+        if plan.frontier:
+            block_store.save_crawl_cursor(
+                pid, plan.frontier, plan.edited, plan.seen,
+                labels=plan.kept | {int(l) for l in labels}
+            )
+        elif plan.resumed:
+            block_store.clear_crawl_cursor(pid)
+        if on_commit is not None and plan.complete:
+            on_commit(pid)
+
+    if plan.superseded:
+        print(f"   ↳ tombstoning {len(plan.superseded)} chunks ({len(dead)} vectors freed)")
+        index_writer.tombstone(plan.superseded, dead)
+
+    if plan.chunks or plan.shared:
+        labels = index_writer.add(vecs, plan.metas, on_commit=commit, shared=plan.shared_metas())
+        if not committed:
+            dups.add_pending([int(l) for l in labels[:len(plan.chunks)]], plan.sigs)
+    else:
+        index_writer.after_commit(commit)
+
+def incremental_index_page(page, blocks=None, on_commit=None, complete=True):
+    """
+    Re-index the changed blocks of a page and tombstone the chunks of
+    blocks that changed or (for a complete crawl) disappeared.
+    """
+    if blocks is None:
+        print("   ↳ flattening")
+        blocks, pending = flatten_blocks(page["id"])
+        complete = not pending
+
+    plan = plan_page(page, blocks, complete)
+    print(f"   ↳ blocks: {len(blocks)}, new chunks: {len(plan.chunks)}, shared: {len(plan.shared)}")
+
+    vecs = None
+    if plan.chunks:
+        print(f"   ↳ embedding {len(plan.chunks)} chunks")
+        vecs = embed_chunks(plan.chunks)
+
+    apply_page(plan, vecs, on_commit)
+    print("   ↳ page complete")
 
-    with open(META_PATH, "a", encoding="utf-8") as f:
-        for m in new_meta:
-            f.write(json.dumps(m) + "\n")
+# ============================================================
+# INGESTION PIPELINE
+# ============================================================
+#
+#   pages ─▶ crawl (xN) ─▶ chunk/hash (xM) ─▶ embed (batched) ─▶ write
+#
+# Stages are connected by bounded queues: a slow stage backpressures the
+# ones before it, while Notion crawling and Ollama embedding overlap.
+
+_STAGE_DONE = object()
+
+class StageStats:
+    """
+    Per-stage item counts, busy time and errors for one pipeline run.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def _stage(self, name, unit):
+        return self.stages.setdefault(name, {"unit": unit, "items": 0, "busy": 0.0, "errors": 0})
+
+    def record(self, name, items, seconds, unit="items"):
+        st = self._stage(name, unit)
+        st["items"] += items
+        st["busy"] += seconds
+
+    def error(self, name):
+        self._stage(name, "items")["errors"] += 1
+
+    def report(self):
+        wall = max(time.perf_counter() - self.started, 1e-9)
+        print(f"[RAG] pipeline finished in {wall:.1f}s")
+        for name, st in self.stages.items():
+            print(f"[RAG]   {name:<6} {st['items']:>7} {st['unit']:<6} "
+                  f"{st['items'] / wall:>8.1f}/s  busy {st['busy']:.1f}s  "
+                  f"errors {st['errors']}")
+
+async def crawl_and_index(crawler, pages, on_done=None):
+    """
+    Run pages through the ingestion pipeline. Returns the pages that
+    failed or could only be partially walked.
+    """
+    if not pages:
+        return []
+
+    stats = StageStats()
+    row_policy = RowBodyPolicy(block_store)
+    incomplete = []
+    total = len(pages)
+    written = 0
+
+    todo = asyncio.Queue()
+    for p in pages:
+        todo.put_nowait(p)
+    crawled = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    planned = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    embedded = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+
+    def failed(stage, page, e):
+        print(f"[RAG][ERROR] {stage} failed for page {page['id']}: {e}")
+        stats.error(stage)
+        incomplete.append(page)
+
+    async def crawl_worker():
+        while True:
+            try:
+                p = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t = time.perf_counter()
+            try:
+                # Continue an unfinished sweep of this page if there is one.
+                cursor = block_store.crawl_cursor(p["id"])
+                frontier = cursor["frontier"] if cursor else None
+                has_body = None
+                if database_id(p):
+                    blocks, pending, has_body = await crawl_row(crawler, p, row_policy, frontier)
+                else:
+                    blocks, pending = await crawler.flatten_blocks(p["id"], frontier=frontier)
+            except Exception as e:
+                failed("crawl", p, e)
+                continue
+            stats.record("crawl", 1, time.perf_counter() - t, "pages")
+            await crawled.put((p, blocks, pending, cursor, has_body))
+
+    async def chunk_worker():
+        while (item := await crawled.get()) is not _STAGE_DONE:
+            p, blocks, pending, cursor, has_body = item
+            t = time.perf_counter()
+            try:
+                plan = await asyncio.to_thread(
+                    plan_page, p, blocks, not pending, pending, cursor, has_body
+                )
+            except Exception as e:
+                failed("chunk", p, e)
+                continue
+            stats.record("chunk", len(plan.chunks), time.perf_counter() - t, "chunks")
+            await planned.put(plan)
+
+    async def embed_plans(batch):
+        texts = [c for plan in batch for c in plan.chunks]
+        t = time.perf_counter()
+        vecs = None
+        if texts:
+            vecs = await asyncio.to_thread(embed_chunks, texts)
+            stats.record("embed", len(texts), time.perf_counter() - t, "chunks")
+
+        out, start = [], 0
+        for plan in batch:
+            end = start + len(plan.chunks)
+            out.append((plan, vecs[start:end] if plan.chunks else None))
+            start = end
+        return out
+
+    async def embedder():
+        finished = False
+        while not finished:
+            # Wait for one page, then take whatever else is already queued.
+            batch = [await planned.get()]
+            pending = len(batch[0].chunks) if batch[0] is not _STAGE_DONE else 0
+            while batch[-1] is not _STAGE_DONE and pending < PIPELINE_EMBED_BATCH:
+                try:
+                    batch.append(planned.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+                if batch[-1] is not _STAGE_DONE:
+                    pending += len(batch[-1].chunks)
+            if batch[-1] is _STAGE_DONE:
+                batch.pop()
+                finished = True
 
-    print("   ↳ page complete")
+            try:
+                results = await embed_plans(batch)
+            except Exception:
+                # Retry page by page so one bad page doesn't sink the batch.
+                results = []
+                for plan in batch:
+                    try:
+                        results.extend(await embed_plans([plan]))
+                    except Exception as e:
+                        failed("embed", plan.page, e)
+
+            for item in results:
+                await embedded.put(item)
+        await embedded.put(_STAGE_DONE)
+
+    async def writer():
+        nonlocal written
+        while (item := await embedded.get()) is not _STAGE_DONE:
+            plan, vecs = item
+            t = time.perf_counter()
+            try:
+                await asyncio.to_thread(apply_page, plan, vecs, on_done)
+            except Exception as e:
+                failed("write", plan.page, e)
+                continue
+            stats.record("write", 1, time.perf_counter() - t, "pages")
+            written += 1
+            print(f"[RAG] ({written}/{total}) Page {plan.page['id']}: "
+                  f"{len(plan.chunks)} chunks, {len(plan.shared)} shared, "
+                  f"{len(plan.superseded)} superseded")
+            if not plan.complete:
+                incomplete.append(plan.page)
+
+    async def crawl_stage():
+        await asyncio.gather(*(crawl_worker() for _ in range(NOTION_PAGE_CONCURRENCY)))
+        for _ in range(PIPELINE_CHUNK_WORKERS):
+            await crawled.put(_STAGE_DONE)
+
+    async def chunk_stage():
+        await asyncio.gather(*(chunk_worker() for _ in range(PIPELINE_CHUNK_WORKERS)))
+        await planned.put(_STAGE_DONE)
+
+    await asyncio.gather(crawl_stage(), chunk_stage(), embedder(), writer())
+    stats.report()
+    return incomplete
 
 # ============================================================
 # BOOTSTRAP + DAEMON
 # ============================================================
 
+def unchanged_pages(pages):
+    """
+    Split listed pages into (changed, unchanged) by the edit time stored
+    when each was last fully indexed.
+    """
+    known = block_store.page_edit_times()
+    changed, unchanged = [], []
+    for p in pages:
+        same = known.get(p["id"]) == page_edit_time(p)
+        (unchanged if same else changed).append(p)
+    return changed, unchanged
+
+def next_watermark(watermark, pages, incomplete):
+    """
+    Newest edit time listed, held back below any page that still has to
+    be retried so the next sync lists it again.
+    """
+    wm = max([watermark] + [page_edit_time(p) for p in pages])
+    if incomplete:
+        wm = min(wm, min(page_edit_time(p) for p in incomplete) - 1)
+    return max(watermark, wm)
+
 def bootstrap_full_index():
     print("[RAG] Bootstrap indexing started")
 
-    init_block_db()
-    pages = all_pages()
-    done_pages = load_page_checkpoint()
+    block_store.backfill_labels(chunk_store)
+    block_store.backfill_sigs(chunk_store)
+    lexical_index.backfill(chunk_store)
 
-    print(f"[RAG] Total pages: {len(pages)}")
-    print(f"[RAG] Already done: {len(done_pages)}")
+    block_store.import_page_checkpoint()
+    done_pages = block_store.done_pages()
+    state = load_state()
 
-    for i, p in enumerate(pages, start=1):
-        pid = p["id"]
-        if pid in done_pages:
-            continue
+    async def run():
+        async with NotionCrawler() as crawler:
+            pages = await crawler.all_pages()
+            databases = [d["id"] for d in await crawler.databases()]
+            pages = await with_database_rows(crawler, pages, databases)
 
-        print(f"[RAG] ({i}/{len(pages)}) Page {pid}")
-        try:
-            incremental_index_page(p)
-            done_pages.add(pid)
-            save_page_checkpoint(done_pages)
-        except Exception as e:
-            print(f"[RAG][ERROR] page failed {pid}: {e}")
+            print(f"[RAG] Total pages: {len(pages)} ({len(databases)} databases)")
+            print(f"[RAG] Already done: {len(done_pages)}")
 
-    save_state({"last_sync_time": time.time()})
+            todo, _ = unchanged_pages(p for p in pages if p["id"] not in done_pages)
+            incomplete = await crawl_and_index(crawler, todo, on_done=block_store.mark_page_done)
+            print(f"[RAG] Notion API calls: {crawler.api_calls}")
+            return next_watermark(state.get("watermark", 0), pages, incomplete)
+
+    watermark = asyncio.run(run())
+    index_writer.checkpoint()
+
+    # Only advance once everything listed is durably indexed.
+    state["watermark"] = watermark
+    save_state(state)
     print("[RAG] Bootstrap indexing completed")
 
 def notion_sync_daemon():
     state = load_state()
+
+    async def sync_once():
+        # Indexes written before per-page edit times fall back to the old
+        # wall-clock sync time once.
+        watermark = state.get("watermark", state.get("last_sync_time", 0))
+        async with NotionCrawler() as crawler:
+            since = watermark - NOTION_WATERMARK_SLACK_SEC
+            pages = await crawler.pages_edited_since(since)
+            # Only databases with a recently edited row are queried.
+            databases = {database_id(p) for p in pages} - {None}
+            pages = await with_database_rows(crawler, pages, databases, since)
+            changed, unchanged = unchanged_pages(pages)
+            print(f"[RAG] sync: {len(pages)} listed, {len(changed)} changed, "
+                  f"{len(unchanged)} unchanged")
+            incomplete = await crawl_and_index(crawler, changed)
+            print(f"[RAG] Notion API calls: {crawler.api_calls}")
+            return next_watermark(watermark, pages, incomplete)
+
     while True:
         try:
-            pages = all_pages()
-            for p in pages:
-                last_edit = p.get("last_edited_time")
-                if last_edit and notion_time_to_epoch(last_edit) > state["last_sync_time"]:
-                    incremental_index_page(p)
-
-            state["last_sync_time"] = time.time()
+            watermark = asyncio.run(sync_once())
+            index_writer.checkpoint()
+            state["watermark"] = watermark
             save_state(state)
         except Exception as e:
             print("[RAG daemon error]", e)
 
-        time.sleep(600)
+        time.sleep(NOTION_SYNC_INTERVAL_SEC)
 
 # ============================================================
 # ENTRYPOINT
@@ -432,3 +2279,4 @@ if __name__ == "__main__":
             time.sleep(60)
     except KeyboardInterrupt:
         print("Shutting down.")
+        index_writer.close()
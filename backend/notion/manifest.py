@@ -0,0 +1,48 @@
+# manifest.py
+import os
+import json
+
+# ============================================================
+# INDEX MANIFEST
+# ============================================================
+#
+# Small JSON file written next to the HNSW index by the indexer:
+#
+#   {"embed_model": ..., "dim": ..., "space": ..., "M": ...,
+#    "ef_construction": ..., "ef": ..., "count": ..., "labels": ...,
+#    "updated_at": ...}
+#
+# "ef" may be replaced by bench_ef.py --write, which also records how it
+# was chosen under "ef_tuning"; the indexer carries both forward.
+#
+# It lets readers open the index without embedding anything and check
+# that their query embedder matches the one used to build it.
+
+def manifest_path(index_path):
+    base, _ = os.path.splitext(index_path)
+    return base + ".manifest.json"
+
+def read_manifest(index_path):
+    p = manifest_path(index_path)
+    if not os.path.exists(p):
+        return None
+    with open(p, "r") as f:
+        return json.load(f)
+
+def write_manifest(index_path, manifest):
+    p = manifest_path(index_path)
+    tmp = p + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, p)
+
+def update_manifest(index_path, **fields):
+    """
+    Merge `fields` into an existing manifest (e.g. a tuned "ef").
+    """
+    manifest = read_manifest(index_path)
+    if manifest is None:
+        raise FileNotFoundError(manifest_path(index_path))
+    manifest.update(fields)
+    write_manifest(index_path, manifest)
+    return manifest
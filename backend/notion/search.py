@@ -2,12 +2,31 @@
 import os
 import json
 import time
+import atexit
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 import numpy as np
 import hnswlib
 import httpx
-import ollama
 from dotenv import load_dotenv, find_dotenv
 
+try:
+    from .chunk_store import ChunkStore
+    from .embed_cache import EmbeddingCache
+    from .lexical_index import LexicalIndex, is_identifier_query, query_identifiers
+    from .manifest import read_manifest
+    from .vector_store import VectorStore, normalize
+    from .snapshots import current_snapshot, snapshot_path
+except ImportError:  # run as a script from notion/
+    from chunk_store import ChunkStore
+    from embed_cache import EmbeddingCache
+    from lexical_index import LexicalIndex, is_identifier_query, query_identifiers
+    from manifest import read_manifest
+    from vector_store import VectorStore, normalize
+    from snapshots import current_snapshot, snapshot_path
+
 # ============================================================
 # ENV
 # ============================================================
@@ -17,14 +36,48 @@ load_dotenv(find_dotenv(), override=True)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ARTIFACTS_DIR = os.path.join(BASE_DIR, "artifacts")
 
-INDEX_PATH = os.path.join(ARTIFACTS_DIR, "notion_hnsw_hnswlib.index")
-META_PATH  = os.path.join(ARTIFACTS_DIR, "meta.jsonl")
+INDEX_NAME = "notion_hnsw_hnswlib.index"
+INDEX_PATH = os.path.join(ARTIFACTS_DIR, INDEX_NAME)
 
 OLLAMA_BASE  = os.getenv("OLLAMA_BASE", "http://localhost:11435")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL")
-OLLAMA_EMBED_MODEL = "nomic-embed-text:latest"
+# Optional override; by default the query embedder is whatever the index
+# manifest says the indexer used.
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL")
+LEGACY_EMBED_MODEL = "qllama/bge-small-en-v1.5"
 
 OLLAMA_TIMEOUT_SEC = int(os.getenv("OLLAMA_TIMEOUT_SEC", "600"))
+OLLAMA_EMBED_TIMEOUT_SEC = float(os.getenv("OLLAMA_EMBED_TIMEOUT_SEC", "30"))
+OLLAMA_CONNECT_TIMEOUT_SEC = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SEC", "5"))
+
+# Connection pool per Ollama backend, shared by chat and embeddings.
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+OLLAMA_POOL_KEEPALIVE = int(os.getenv("OLLAMA_POOL_KEEPALIVE", "4"))
+OLLAMA_KEEPALIVE_SEC = float(os.getenv("OLLAMA_KEEPALIVE_SEC", "120"))
+
+# "auto" scans quantized vectors when the index has them; "hnsw" forces the graph.
+SEARCH_BACKEND = os.getenv("RAG_SEARCH_BACKEND", "auto")
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "200"))
+# Neighbours fetched per query before scoring; bench_ef.py tunes ef for it.
+SEARCH_CANDIDATES = int(os.getenv("RAG_SEARCH_CANDIDATES", "50"))
+# BM25 hits fused with the vector neighbours (0 disables lexical search),
+# and the reciprocal-rank-fusion constant.
+LEXICAL_CANDIDATES = int(os.getenv("RAG_LEXICAL_CANDIDATES", "50"))
+RRF_K = 60
+
+# Query embeddings kept in memory (0 disables), and an optional SQLite
+# file that keeps them across restarts.
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_PATH = os.getenv("RAG_QUERY_CACHE_PATH")
+
+# Answers reused for paraphrased queries against the same index version
+# (size 0 disables).
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SEC = float(os.getenv("RAG_ANSWER_CACHE_TTL_SEC", "3600"))
+
+# How often to look for a newer index snapshot (0 disables hot reload).
+RELOAD_INTERVAL_SEC = float(os.getenv("RAG_RELOAD_INTERVAL_SEC", "5"))
 
 if not OLLAMA_MODEL:
     raise RuntimeError("Set OLLAMA_MODEL in .env (example: llama3.1:8b-instruct)")
@@ -36,37 +89,282 @@ if not OLLAMA_MODEL:
 class LLMError(RuntimeError):
     pass
 
+class OllamaPool:
+    """
+    Keep-alive connections to one Ollama backend: a sync httpx.Client and
+    an async one per event loop, both created on first use. The sync one
+    is closed at exit, async ones when replaced or by aclose_pools() (the
+    agent server's shutdown). Every request carries its own timeout, and connection setups
+    are counted through httpx's trace extension so reuse is visible.
+    """
+
+    def __init__(self, base):
+        self.base = base.rstrip("/")
+        self._lock = threading.Lock()
+        self._client = None
+        self._aclient = None
+        self._aloop = None
+        self._retiring = set()
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=OLLAMA_POOL_SIZE,
+            max_keepalive_connections=OLLAMA_POOL_KEEPALIVE,
+            keepalive_expiry=OLLAMA_KEEPALIVE_SEC
+        )
+
+    def _timeout(self, seconds):
+        return httpx.Timeout(seconds, connect=OLLAMA_CONNECT_TIMEOUT_SEC)
+
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    base_url=self.base, limits=self._limits(),
+                    timeout=self._timeout(OLLAMA_TIMEOUT_SEC)
+                )
+            return self._client
+
+    def aclient(self) -> httpx.AsyncClient:
+        # An AsyncClient is tied to the loop it first ran on.
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._aclient is None or self._aloop is not loop:
+                if self._aclient is not None:
+                    self._retire(self._aclient, self._aloop)
+                self._aclient = httpx.AsyncClient(
+                    base_url=self.base, limits=self._limits(),
+                    timeout=self._timeout(OLLAMA_TIMEOUT_SEC)
+                )
+                self._aloop = loop
+            return self._aclient
+
+    def _retire(self, client, loop):
+        """
+        Close an AsyncClient that is being dropped, on the loop it ran on.
+        """
+        if loop is None or loop.is_closed():
+            # Its connections went with the loop; nothing can close them now.
+            return
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        if loop is current:
+            task = loop.create_task(self._aclose_quietly(client))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+        elif current is None and not loop.is_running():
+            loop.run_until_complete(self._aclose_quietly(client))
+        else:
+            # Running in another thread, or idle until it runs again.
+            asyncio.run_coroutine_threadsafe(self._aclose_quietly(client), loop)
+
+    @staticmethod
+    async def _aclose_quietly(client):
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"[search][WARN] closing a stale Ollama client failed: {e}")
+
+    def _trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self.connections += 1
+
+    async def _atrace(self, event, info):
+        self._trace(event, info)
+
+    def post(self, path, timeout=OLLAMA_TIMEOUT_SEC, **kwargs) -> httpx.Response:
+        self.requests += 1
+        try:
+            return self.client().post(
+                path, timeout=self._timeout(timeout),
+                extensions={"trace": self._trace}, **kwargs
+            )
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    async def apost(self, path, timeout=OLLAMA_TIMEOUT_SEC, **kwargs) -> httpx.Response:
+        self.requests += 1
+        try:
+            return await self.aclient().post(
+                path, timeout=self._timeout(timeout),
+                extensions={"trace": self._atrace}, **kwargs
+            )
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    @asynccontextmanager
+    async def astream(self, path, timeout=OLLAMA_TIMEOUT_SEC, **kwargs):
+        """
+        POST and yield the response before its body is read.
+        """
+        self.requests += 1
+        try:
+            async with self.aclient().stream(
+                "POST", path, timeout=self._timeout(timeout),
+                extensions={"trace": self._atrace}, **kwargs
+            ) as r:
+                yield r
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "errors": self.errors,
+            "reuse_rate": 1.0 - self.connections / self.requests if self.requests else 0.0,
+        }
+
+    async def aclose(self):
+        """
+        Close the async client, from its own loop when it's this one.
+        """
+        with self._lock:
+            client, loop = self._aclient, self._aloop
+            self._aclient = self._aloop = None
+        if client is None:
+            return
+        if loop is asyncio.get_running_loop():
+            await client.aclose()
+        else:
+            self._retire(client, loop)
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            if self._aclient is not None:
+                self._retire(self._aclient, self._aloop)
+            self._aclient = None
+            self._aloop = None
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def ollama_pool(base=OLLAMA_BASE) -> OllamaPool:
+    with _pools_lock:
+        pool = _pools.get(base)
+        if pool is None:
+            pool = _pools[base] = OllamaPool(base)
+        return pool
+
+def ollama_pool_stats() -> dict:
+    """
+    {backend: {requests, connections, errors, reuse_rate}}.
+    """
+    with _pools_lock:
+        return {base: pool.stats() for base, pool in _pools.items()}
+
+async def aclose_pools():
+    """
+    Close every pool's async client; await from the serving loop on
+    shutdown, before it stops.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        await pool.aclose()
+
+@atexit.register
+def _close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+
 class OllamaClient:
-    def chat(self, messages, temperature=0.2, max_tokens=800):
-        url = f"{OLLAMA_BASE.rstrip('/')}/api/chat"
-        payload = {
+    def __init__(self, base=OLLAMA_BASE):
+        self.pool = ollama_pool(base)
+
+    def _payload(self, messages, temperature, max_tokens, stream=False):
+        return {
             "model": OLLAMA_MODEL,
             "messages": messages,
-            "stream": False,
+            "stream": stream,
             "options": {
                 "temperature": float(temperature),
                 "num_predict": int(max_tokens)
             }
         }
 
+    @staticmethod
+    def _content(r):
+        if r.status_code >= 400:
+            raise LLMError(f"Ollama error {r.status_code}: {r.text}")
+
+        data = r.json()
+        msg = data.get("message", {})
+        content = msg.get("content")
+        if not content:
+            raise LLMError("Empty Ollama response")
+
+        return content.strip()
+
+    def chat(self, messages, temperature=0.2, max_tokens=800):
+        payload = self._payload(messages, temperature, max_tokens)
+
         for attempt in range(3):
             try:
-                with httpx.Client(timeout=OLLAMA_TIMEOUT_SEC) as client:
-                    r = client.post(url, json=payload)
+                return self._content(self.pool.post("/api/chat", json=payload))
+            except Exception as e:
+                if attempt < 2:
+                    time.sleep(1.5 * (attempt + 1))
+                else:
+                    raise LLMError(str(e))
 
-                if r.status_code >= 400:
-                    raise LLMError(f"Ollama error {r.status_code}: {r.text}")
+    async def achat(self, messages, temperature=0.2, max_tokens=800):
+        payload = self._payload(messages, temperature, max_tokens)
 
-                data = r.json()
-                msg = data.get("message", {})
-                content = msg.get("content")
-                if not content:
-                    raise LLMError("Empty Ollama response")
+        for attempt in range(3):
+            try:
+                return self._content(await self.pool.apost("/api/chat", json=payload))
+            except Exception as e:
+                if attempt < 2:
+                    await asyncio.sleep(1.5 * (attempt + 1))
+                else:
+                    raise LLMError(str(e))
+
+    async def achat_stream(self, messages, temperature=0.2, max_tokens=800):
+        """
+        Yield answer tokens as Ollama generates them. Failures are retried
+        only until the first token has been yielded.
+        """
+        payload = self._payload(messages, temperature, max_tokens, stream=True)
 
-                return content.strip()
+        for attempt in range(3):
+            started = False
+            try:
+                async with self.pool.astream("/api/chat", json=payload) as r:
+                    if r.status_code >= 400:
+                        raise LLMError(f"Ollama error {r.status_code}: {(await r.aread()).decode()}")
+                    async for line in r.aiter_lines():
+                        if not line.strip():
+                            continue
+                        data = json.loads(line)
+                        if data.get("error"):
+                            raise LLMError(f"Ollama error: {data['error']}")
+                        token = data.get("message", {}).get("content")
+                        if token:
+                            started = True
+                            yield token
+                        if data.get("done"):
+                            break
+                if not started:
+                    raise LLMError("Empty Ollama response")
+                return
             except Exception as e:
+                if started:
+                    raise LLMError(str(e))
                 if attempt < 2:
-                    time.sleep(1.5 * (attempt + 1))
+                    await asyncio.sleep(1.5 * (attempt + 1))
                 else:
                     raise LLMError(str(e))
 
@@ -76,49 +374,276 @@ _ollama = OllamaClient()
 # EMBEDDINGS
 # ============================================================
 
+_embed_model = OLLAMA_EMBED_MODEL or LEGACY_EMBED_MODEL
+
+class QueryEmbeddingCache:
+    """
+    LRU of query vectors keyed by (embed model, normalized query), backed
+    by an EmbeddingCache file when `path` is set. Cached vectors are
+    read-only.
+    """
+
+    def __init__(self, size=QUERY_CACHE_SIZE, path=QUERY_CACHE_PATH):
+        self.size = size
+        self.disk = EmbeddingCache(path) if path and size > 0 else None
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split()).casefold()
+
+    def get(self, model, query):
+        if self.size <= 0:
+            return None
+        key = (model, self.normalize(query))
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vec
+        if self.disk is not None:
+            vec = self.disk.get(model, key[1])
+            if vec is not None:
+                self.disk_hits += 1
+                self._remember(key, vec)
+                return vec
+        self.misses += 1
+        return None
+
+    def put(self, model, query, vec):
+        if self.size <= 0:
+            return
+        key = (model, self.normalize(query))
+        self._remember(key, vec)
+        if self.disk is not None:
+            self.disk.put(model, key[1], vec)
+
+    def _remember(self, key, vec):
+        vec = np.array(vec, dtype="float32")
+        vec.flags.writeable = False
+        with self._lock:
+            self._lru[key] = vec
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._lru),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+query_cache = QueryEmbeddingCache()
+
+def _embed_payload(text):
+    return {"model": _embed_model, "input": f"search_query: {text}"}
+
+def _embedding(r) -> np.ndarray:
+    if r.status_code >= 400:
+        raise LLMError(f"Ollama embedding failed: {r.status_code}: {r.text}")
+    return np.asarray(r.json()["embeddings"][0], dtype="float32")
+
 def ollama_embed(text: str) -> np.ndarray:
+    vec = query_cache.get(_embed_model, text)
+    if vec is not None:
+        return vec
     try:
-        r = ollama.embeddings(
-            model=OLLAMA_EMBED_MODEL,
-            prompt=f"search_query: {text}"
-        )
-        return np.asarray(r["embedding"], dtype="float32")
+        r = _ollama.pool.post("/api/embed", timeout=OLLAMA_EMBED_TIMEOUT_SEC, json=_embed_payload(text))
+        vec = _embedding(r)
+    except LLMError:
+        raise
     except Exception as e:
         raise LLMError(f"Ollama embedding failed: {e}")
+    query_cache.put(_embed_model, text, vec)
+    return vec
+
+async def aollama_embed(text: str) -> np.ndarray:
+    vec = query_cache.get(_embed_model, text)
+    if vec is not None:
+        return vec
+    try:
+        r = await _ollama.pool.apost("/api/embed", timeout=OLLAMA_EMBED_TIMEOUT_SEC, json=_embed_payload(text))
+        vec = _embedding(r)
+    except LLMError:
+        raise
+    except Exception as e:
+        raise LLMError(f"Ollama embedding failed: {e}")
+    query_cache.put(_embed_model, text, vec)
+    return vec
 
 # ============================================================
-# LOAD INDEX + META (ONCE)
+# LOAD INDEX + META (VERSIONED SNAPSHOTS)
 # ============================================================
 
-_index = None
-_meta  = None
-_DIM   = None
+class CompressedIndex:
+    """
+    Stand-in for hnswlib.Index when the indexer keeps quantized vectors:
+    a coarse scan over int8/float16 codes followed by an exact float32
+    cosine rerank of the best RERANK_CANDIDATES.
+    """
 
-def _init_index_and_meta():
-    global _index, _meta, _DIM
+    def __init__(self, vectors, meta):
+        self.vectors = vectors
+        self.meta = meta
+
+    def knn_query(self, q, k=1):
+        return self.vectors.search(
+            q, k,
+            active=self.meta.active_flags(),
+            rerank=max(RERANK_CANDIDATES, k)
+        )
 
-    if _index is None:
-        if not os.path.exists(INDEX_PATH):
+    def get_current_count(self):
+        return len(self.vectors)
+
+def _resolve_embedder(manifest):
+    """
+    Pick the query embedder from the manifest, refusing an explicit
+    OLLAMA_EMBED_MODEL that differs from the one the index was built with.
+    """
+    global _embed_model
+
+    built_with = manifest.get("embed_model")
+    if OLLAMA_EMBED_MODEL and built_with and OLLAMA_EMBED_MODEL != built_with:
+        raise RuntimeError(
+            f"OLLAMA_EMBED_MODEL={OLLAMA_EMBED_MODEL} but the index was built "
+            f"with {built_with}; unset it or rebuild the index."
+        )
+    _embed_model = built_with or _embed_model
+
+class IndexSnapshot:
+    """
+    Index + metadata + manifest of one published snapshot (or of the live
+    artifacts directory for indexes that predate snapshots). Immutable
+    once loaded, so queries can keep using it while a newer one loads.
+    """
+
+    def __init__(self, directory, name=None):
+        self.directory = directory
+        self.name = name
+
+        if not ChunkStore.exists(directory):
+            raise RuntimeError("Chunk metadata not found. Run main.py first.")
+        self.meta = ChunkStore(directory)
+
+        index_path = os.path.join(directory, INDEX_NAME)
+        if not os.path.exists(index_path):
             raise RuntimeError("Vector index not found. Run main.py first.")
 
-        # Load meta to determine dim
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            first = json.loads(next(f))
-            _DIM = len(ollama_embed(first["text"]))
+        manifest = read_manifest(index_path)
+        if manifest:
+            _resolve_embedder(manifest)
+            self.dim = manifest["dim"]
+            space = manifest.get("space", "cosine")
+            ef = manifest.get("ef", 256)
+            quant = manifest.get("vector_quant")
+        else:
+            # Index predates the manifest: embed one stored chunk to get dim
+            print("[search][WARN] no index manifest; probing dimension with an embedding call")
+            manifest = {}
+            self.dim = len(ollama_embed(self.meta.text(0)))
+            space, ef, quant = "cosine", 256, None
+        self.manifest = manifest
+        self.version = manifest.get("version", 0)
+        self.ef = ef
+        # knn_query fails when asked for more neighbours than live vectors.
+        flags = self.meta.active_flags()
+        self.live = int(np.count_nonzero(flags))
+
+        if quant and SEARCH_BACKEND != "hnsw":
+            vectors = VectorStore(directory, self.dim, quant)
+            self.index = CompressedIndex(vectors, self.meta)
+        else:
+            idx = hnswlib.Index(space=space, dim=self.dim)
+            idx.load_index(index_path)
+            idx.set_ef(ef)
+            self.index = idx
+            # Near-duplicate rows have no element of their own, while a
+            # hidden row's element lives on as long as a sharer is active.
+            shared = self.meta.shared_rows()
+            held = {v for l, v in shared.items() if flags[l] and not flags[v]}
+            self.live += len(held) - sum(1 for l in shared if flags[l])
+
+    def refresh_ef(self):
+        """
+        Apply an ef retuned in place (bench_ef.py --write) to this snapshot.
+        """
+        if not isinstance(self.index, hnswlib.Index):
+            return
+        manifest = read_manifest(os.path.join(self.directory, INDEX_NAME)) or {}
+        ef = manifest.get("ef")
+        if ef and ef != self.ef:
+            self.index.set_ef(int(ef))
+            self.ef = ef
+            print(f"[search] ef set to {ef}")
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def _load_snapshot():
+    name = current_snapshot(ARTIFACTS_DIR)
+    directory = snapshot_path(ARTIFACTS_DIR, name) if name else ARTIFACTS_DIR
+    return IndexSnapshot(directory, name)
+
+def _reload_loop():
+    """
+    Poll CURRENT and swap in newly published snapshots. The new snapshot
+    is fully loaded before the (atomic) reference swap, so in-flight
+    queries finish on the one they started with.
+    """
+    global _snapshot
+
+    while True:
+        time.sleep(RELOAD_INTERVAL_SEC)
+        try:
+            name = current_snapshot(ARTIFACTS_DIR)
+            if name and name != _snapshot.name:
+                fresh = _load_snapshot()
+                _snapshot = fresh
+                print(f"[search] loaded index snapshot {fresh.name}")
+            else:
+                _snapshot.refresh_ef()
+        except Exception as e:
+            print(f"[search][WARN] snapshot reload failed: {e}")
+
+def _get_snapshot() -> IndexSnapshot:
+    global _snapshot
+
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = _load_snapshot()
+                if RELOAD_INTERVAL_SEC > 0:
+                    threading.Thread(target=_reload_loop, daemon=True).start()
+    return _snapshot
 
-        idx = hnswlib.Index(space="cosine", dim=_DIM)
-        idx.load_index(INDEX_PATH)
-        idx.set_ef(256)
-        _index = idx
+def _init_index_and_meta():
+    snap = _get_snapshot()
+    return snap.index, snap.meta
+
+_lexical = None
 
-    if _meta is None:
-        metas = []
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                metas.append(json.loads(line))
-        _meta = metas
+def _get_lexical():
+    """
+    The indexer's live BM25 index (opened read-only), or None if there is
+    none yet. Hits are filtered against the caller's snapshot.
+    """
+    global _lexical
 
-    return _index, _meta
+    if _lexical is None and LEXICAL_CANDIDATES > 0 and LexicalIndex.exists(ARTIFACTS_DIR):
+        with _snapshot_lock:
+            if _lexical is None:
+                _lexical = LexicalIndex(ARTIFACTS_DIR)
+    return _lexical
 
 # ============================================================
 # RANKING UTILITIES
@@ -146,7 +671,7 @@ def score_chunk(dist, meta):
 # ANSWER GENERATION
 # ============================================================
 
-def generate_answer(query: str, context: str) -> str:
+def answer_messages(query: str, context: str) -> list:
     system = (
         "You are a helpful assistant.\n"
         "Answer ONLY using the provided context.\n"
@@ -155,48 +680,193 @@ def generate_answer(query: str, context: str) -> str:
         "Do not hallucinate."
     )
 
-    messages = [
+    return [
         {"role": "system", "content": system},
         {"role": "user", "content": f"Question:\n{query}\n\nContext:\n{context}"}
     ]
 
-    return _ollama.chat(messages, temperature=0.2, max_tokens=800)
+def generate_answer(query: str, context: str) -> str:
+    return _ollama.chat(answer_messages(query, context), temperature=0.2, max_tokens=800)
+
+# ============================================================
+# SEMANTIC ANSWER CACHE
+# ============================================================
+
+class AnswerCache:
+    """
+    (query vector, answer, sources) of recent answers. A query whose
+    cosine similarity to a cached one reaches `threshold` and that names
+    the same identifiers (ABC-123 and ABC-124 embed almost alike) gets its
+    answer back, as long as the index snapshot version is unchanged;
+    entries of older versions are dropped on sight. LRU beyond `size`,
+    plus a TTL.
+    """
+
+    def __init__(self, size=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD,
+                 ttl=ANSWER_CACHE_TTL_SEC):
+        self.size = size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _prune(self, version):
+        now = time.time()
+        for key, e in list(self._entries.items()):
+            if e["version"] != version or now - e["created"] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+
+    def get(self, qvec, version, query=""):
+        """
+        {"answer", "sources", "similarity"} of the closest cached query, or None.
+        """
+        if self.size <= 0:
+            return None
+        q = normalize(qvec).reshape(-1)
+        ids = query_identifiers(query)
+        with self._lock:
+            self._prune(version)
+            best, best_sim = None, self.threshold
+            for key, e in self._entries.items():
+                if e["qvec"].shape != q.shape or e["ids"] != ids:
+                    continue
+                sim = float(e["qvec"] @ q)
+                if sim >= best_sim:
+                    best, best_sim = key, sim
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            e = self._entries[best]
+            return {"answer": e["answer"], "sources": list(e["sources"]), "similarity": best_sim}
+
+    def put(self, qvec, version, answer, sources, query=""):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[self._next_id] = {
+                "qvec": normalize(qvec).reshape(-1),
+                "ids": query_identifiers(query),
+                "version": version,
+                "answer": answer,
+                "sources": list(sources),
+                "created": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+answer_cache = AnswerCache()
 
 # ============================================================
 # CORE SEARCH FUNCTION
 # ============================================================
 
-def fetch_notion_content(query: str, top_k: int = 8) -> dict:
+def vector_ranking(snap: IndexSnapshot, qvec) -> list:
     """
-    Used by agents.
-    Returns:
-      {
-        "answer": str,
-        "sources": [{"chunk_idx": int, "url": str}]
-      }
+    Active neighbours of a query vector, best (similarity x recency) first.
+    Rows sharing one vector (near-duplicates) count once, as their best.
     """
-    index, metas = _init_index_and_meta()
+    index, metas = snap.index, snap.meta
 
-    qvec = ollama_embed(query)
-    labels, dists = index.knn_query(qvec, k=50)
+    if qvec.shape[0] != snap.dim:
+        raise LLMError(f"query embedding dim {qvec.shape[0]} != index dim {snap.dim}")
+    k = min(SEARCH_CANDIDATES, snap.live)
+    if k <= 0:
+        return []
+    labels, dists = index.knn_query(qvec, k=k)
 
-    scored = []
+    best = {}
     for idx, dist in zip(labels[0], dists[0]):
-        meta = metas[int(idx)]
-        s = score_chunk(dist, meta)
-        if s is not None:
-            scored.append((s, idx, meta))
+        for label in (int(idx), *metas.sharers(idx)):
+            s = score_chunk(dist, metas.get(label))
+            vector = metas.vector_of(label)
+            if s is not None and (vector not in best or s > best[vector][0]):
+                best[vector] = (s, label)
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top = scored[:top_k]
+    scored = sorted(best.values(), reverse=True)
+    return [idx for _, idx in scored]
 
-    if not top:
-        return {"answer": "I don't know.", "sources": []}
+def lexical_ranking(snap: IndexSnapshot, query: str) -> list:
+    """
+    BM25 hits that exist and are active in this snapshot, best first;
+    rows sharing one vector (near-duplicates) count once, as their best.
+    """
+    lex = _get_lexical()
+    if lex is None:
+        return []
+    try:
+        hits = lex.search(query, 2 * LEXICAL_CANDIDATES)
+    except Exception as e:
+        print(f"[search][WARN] lexical search failed: {e}")
+        return []
+
+    n = len(snap.meta)
+    ranked, vectors = [], set()
+    for label, _ in hits:
+        if label >= n or not snap.meta.is_active(label):
+            continue
+        vector = snap.meta.vector_of(label)
+        if vector not in vectors:
+            vectors.add(vector)
+            ranked.append(label)
+    return ranked[:LEXICAL_CANDIDATES]
+
+def rrf_fuse(rankings, k=RRF_K) -> list:
+    """
+    Reciprocal rank fusion: labels by sum of 1 / (k + rank) over rankings.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, label in enumerate(ranking, start=1):
+            scores[label] = scores.get(label, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def retrieve(snap: IndexSnapshot, query: str, qvec, top_k: int = 8):
+    """
+    (context, sources) of the best `top_k` chunks, fusing the vector
+    neighbours of `qvec` (skipped when None) with BM25 hits for `query`.
+    Context is empty when nothing matched.
+    """
+    rankings = [lexical_ranking(snap, query)]
+    if qvec is not None:
+        rankings.insert(0, vector_ranking(snap, qvec))
+    # Fuse near-duplicates as one vector, shown as the row whose text
+    # matched lexically if any.
+    rows = {}
+    for ranking in reversed(rankings):
+        for label in ranking:
+            rows.setdefault(snap.meta.vector_of(label), label)
+    fused = rrf_fuse([[snap.meta.vector_of(l) for l in r] for r in rankings])
+    top = [rows[v] for v in fused[:top_k]]
 
     context_parts = []
     sources = []
+    cited = set()
 
-    for i, (_, idx, meta) in enumerate(top, start=1):
+    for i, idx in enumerate(top, start=1):
+        if idx in cited:
+            continue
+        meta = snap.meta.get(idx)
         header = f"[S{i}] {meta.get('url','')}"
         body = meta.get("text", "").replace("\n", " ").strip()
         if not body:
@@ -206,12 +876,94 @@ def fetch_notion_content(query: str, top_k: int = 8) -> dict:
             "chunk_idx": idx,
             "url": meta.get("url", "")
         })
+        cited.add(idx)
+        # Near-duplicates elsewhere share this chunk's vector: cite them too.
+        urls = {meta.get("url", "")}
+        vector = snap.meta.vector_of(idx)
+        for other in (vector, *snap.meta.sharers(vector)):
+            if other in cited or not snap.meta.is_active(other):
+                continue
+            url = snap.meta.url(other)
+            if url not in urls:
+                urls.add(url)
+                cited.add(other)
+                sources.append({"chunk_idx": other, "url": url})
+
+    return "\n\n".join(context_parts), sources
+
+def fetch_notion_content(query: str, top_k: int = 8) -> dict:
+    """
+    Used by agents.
+    Returns:
+      {
+        "answer": str,
+        "sources": [{"chunk_idx": int, "url": str}]
+      }
+    """
+    snap = _get_snapshot()
+
+    # Ids, names, error strings: BM25 alone, no embedding call.
+    if is_identifier_query(query):
+        context, sources = retrieve(snap, query, None, top_k)
+        if sources:
+            return {"answer": generate_answer(query, context), "sources": sources}
+
+    qvec = ollama_embed(query)
+    cached = answer_cache.get(qvec, snap.version, query)
+    if cached is not None:
+        return {"answer": cached["answer"], "sources": cached["sources"]}
+
+    context, sources = retrieve(snap, query, qvec, top_k)
+
+    if not sources:
+        return {"answer": "I don't know.", "sources": []}
 
-    context = "\n\n".join(context_parts)
     answer = generate_answer(query, context)
+    answer_cache.put(qvec, snap.version, answer, sources, query)
 
     return {"answer": answer, "sources": sources}
 
+async def stream_notion_content(query: str, top_k: int = 8):
+    """
+    Streaming fetch_notion_content. Yields
+      {"type": "sources", "sources": [...]}   once, before generation
+      {"type": "token", "text": str}          as the answer is generated
+      {"type": "done", "answer": str}         the full answer
+    """
+    snap = _get_snapshot()
+    qvec = None
+    context, sources = "", []
+
+    # Ids, names, error strings: BM25 alone, no embedding call.
+    if is_identifier_query(query):
+        context, sources = retrieve(snap, query, None, top_k)
+
+    if not sources:
+        qvec = await aollama_embed(query)
+        cached = answer_cache.get(qvec, snap.version, query)
+        if cached is not None:
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done", "answer": cached["answer"]}
+            return
+        context, sources = retrieve(snap, query, qvec, top_k)
+
+    yield {"type": "sources", "sources": sources}
+
+    if not sources:
+        answer = "I don't know."
+        yield {"type": "token", "text": answer}
+    else:
+        parts = []
+        async for token in _ollama.achat_stream(answer_messages(query, context), temperature=0.2, max_tokens=800):
+            parts.append(token)
+            yield {"type": "token", "text": token}
+        answer = "".join(parts).strip()
+        if qvec is not None:
+            answer_cache.put(qvec, snap.version, answer, sources, query)
+
+    yield {"type": "done", "answer": answer}
+
 # ============================================================
 # PUBLIC ENTRYPOINT (FOR AGENTS)
 # ============================================================
@@ -227,6 +979,24 @@ def run_search(query: str) -> dict:
 
     return result
 
+async def run_search_stream(query: str):
+    """
+    run_search that prints the answer as it streams, passing the
+    stream_notion_content events on.
+    """
+    print("\n=== Answer ===")
+    sources = []
+    async for event in stream_notion_content(query):
+        if event["type"] == "sources":
+            sources = event["sources"]
+        elif event["type"] == "token":
+            print(event["text"], end="", flush=True)
+        yield event
+
+    print("\n\n=== Sources ===")
+    for s in sources:
+        print(f"- chunk #{s['chunk_idx']} → {s['url']}")
+
 # ============================================================
 # CLI MODE (OPTIONAL)
 # ============================================================
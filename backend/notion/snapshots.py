@@ -0,0 +1,86 @@
+# snapshots.py
+import os
+import shutil
+
+try:
+    from .manifest import write_manifest
+except ImportError:  # run as a script from notion/
+    from manifest import write_manifest
+
+# ============================================================
+# VERSIONED INDEX SNAPSHOTS
+# ============================================================
+#
+#   artifacts/
+#     CURRENT                 "v00000042"
+#     snapshots/v00000042/    index + manifest + chunk/vector files
+#
+# The indexer builds a snapshot in a temporary directory, renames it into
+# place and then atomically replaces CURRENT. Readers only ever open a
+# fully published snapshot. Files that are append-only in the live
+# artifacts are hard-linked (readers bound them by row count); files that
+# are mutated in place are copied.
+
+SNAPSHOT_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+
+def current_snapshot(artifacts_dir):
+    """
+    Name of the published snapshot, or None before the first one.
+    """
+    p = os.path.join(artifacts_dir, CURRENT_FILE)
+    if not os.path.exists(p):
+        return None
+    with open(p, "r") as f:
+        name = f.read().strip()
+    return name or None
+
+def snapshot_path(artifacts_dir, name):
+    return os.path.join(artifacts_dir, SNAPSHOT_DIR, name)
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def publish_snapshot(artifacts_dir, version, index_path, manifest, link=(), copy=(), keep=3):
+    """
+    Publish version `version` made of the saved index, `manifest` and the
+    listed artifact file names. Returns the snapshot directory.
+    """
+    name = f"v{version:08d}"
+    root = os.path.join(artifacts_dir, SNAPSHOT_DIR)
+    tmp = os.path.join(root, f".tmp-{name}")
+    final = os.path.join(root, name)
+
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    index_name = os.path.basename(index_path)
+    _link_or_copy(index_path, os.path.join(tmp, index_name))
+    for fname in link:
+        src = os.path.join(artifacts_dir, fname)
+        if os.path.exists(src):
+            _link_or_copy(src, os.path.join(tmp, fname))
+    for fname in copy:
+        src = os.path.join(artifacts_dir, fname)
+        if os.path.exists(src):
+            shutil.copy2(src, os.path.join(tmp, fname))
+    write_manifest(os.path.join(tmp, index_name), dict(manifest, version=version))
+
+    shutil.rmtree(final, ignore_errors=True)
+    os.rename(tmp, final)
+
+    cur = os.path.join(artifacts_dir, CURRENT_FILE)
+    with open(cur + ".tmp", "w") as f:
+        f.write(name)
+    os.replace(cur + ".tmp", cur)
+
+    _prune(root, keep)
+    return final
+
+def _prune(root, keep):
+    names = sorted(n for n in os.listdir(root) if n.startswith("v"))
+    for n in names[:-keep]:
+        shutil.rmtree(os.path.join(root, n), ignore_errors=True)
@@ -0,0 +1,175 @@
+# vector_store.py
+import os
+import numpy as np
+
+# ============================================================
+# LABEL-ADDRESSED VECTOR FILES
+# ============================================================
+#
+# Row `label` of every file belongs to HNSW label `label`:
+#
+#   vectors.f32     full-precision, L2-normalised float32 (rerank)
+#   vectors.i8      int8 codes, one per dimension          (quant="int8")
+#   vectors.i8s     float32 per-row scale for the int8 codes
+#   vectors.f16     float16 copy                            (quant="float16")
+#
+# Only the compressed file needs to be resident for a coarse scan; the
+# float32 file is memory-mapped and touched for the top candidates only.
+
+QUANT_KINDS = ("int8", "float16")
+
+def normalize(vecs):
+    vecs = np.asarray(vecs, dtype="float32")
+    norms = np.linalg.norm(vecs, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+def hnsw_element_bytes(dim, M):
+    """
+    Approximate resident bytes per reserved hnswlib slot: level-0 links
+    (2M ids + count), vector, label, level/pointer bookkeeping and the
+    expected share of upper-level links (1 / (M - 1) levels per element).
+    """
+    level0 = (2 * M) * 4 + 4 + dim * 4 + 8
+    return int(level0 + 12 + (M * 4 + 4) / (M - 1))
+
+def quantize_int8(vecs):
+    scale = np.abs(vecs).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.rint(vecs / scale[:, None]).astype("int8")
+    return codes, scale.astype("float32")
+
+class VectorStore:
+    SCAN_BLOCK = 16384
+
+    def __init__(self, directory, dim, quant=None, writable=False):
+        if quant not in (None, *QUANT_KINDS):
+            raise ValueError(f"unknown vector quantization {quant!r}")
+        self.directory = directory
+        self.dim = int(dim)
+        self.quant = quant
+        self.writable = writable
+        if writable:
+            os.makedirs(directory, exist_ok=True)
+            self._backfill_quantized()
+        self.refresh()
+
+    @staticmethod
+    def snapshot_files():
+        """
+        Vector files are only written at new labels, so all can be linked.
+        """
+        return ["vectors.f32", "vectors.i8", "vectors.i8s", "vectors.f16"], []
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, f"vectors.{suffix}")
+
+    def _rows(self, suffix, itemsize):
+        p = self._path(suffix)
+        return os.path.getsize(p) // itemsize if os.path.exists(p) else 0
+
+    def __len__(self):
+        return self._rows("f32", 4 * self.dim)
+
+    def _map(self, suffix, dtype, width):
+        n = self._rows(suffix, np.dtype(dtype).itemsize * width)
+        if not n:
+            return np.empty((0, width) if width > 1 else 0, dtype=dtype)
+        shape = (n, width) if width > 1 else (n,)
+        return np.memmap(self._path(suffix), dtype=dtype, mode="r", shape=shape)
+
+    def refresh(self):
+        """
+        (Re)map files; compressed codes are loaded into memory for scans.
+        """
+        self.full = self._map("f32", "float32", self.dim)
+        self.codes = None
+        self.scales = None
+        if self.quant == "int8":
+            self.codes = np.array(self._map("i8", "int8", self.dim))
+            self.scales = np.array(self._map("i8s", "float32", 1))
+        elif self.quant == "float16":
+            self.codes = np.array(self._map("f16", "float16", self.dim))
+
+    # ---------------- writes ----------------
+
+    def _write_rows(self, suffix, first, arr):
+        p = self._path(suffix)
+        row = arr.dtype.itemsize * (arr.shape[1] if arr.ndim > 1 else 1)
+        with open(p, "r+b" if os.path.exists(p) else "wb") as f:
+            f.seek(first * row)
+            f.write(np.ascontiguousarray(arr).tobytes())
+
+    def write(self, first_label, vecs):
+        """
+        Store rows first_label .. first_label + len(vecs) - 1.
+        Does not remap; call refresh() before reading them back here.
+        """
+        vecs = normalize(vecs)
+        self._write_rows("f32", first_label, vecs)
+        self._write_quantized(first_label, vecs)
+
+    def _write_quantized(self, first_label, vecs):
+        if self.quant == "int8":
+            codes, scale = quantize_int8(vecs)
+            self._write_rows("i8", first_label, codes)
+            self._write_rows("i8s", first_label, scale)
+        elif self.quant == "float16":
+            self._write_rows("f16", first_label, vecs.astype("float16"))
+
+    def _backfill_quantized(self):
+        """
+        Build missing compressed rows from vectors.f32 (e.g. quantization
+        was switched on for an existing index).
+        """
+        if self.quant is None:
+            return
+        suffix, itemsize = ("i8s", 4) if self.quant == "int8" else ("f16", 2 * self.dim)
+        done = self._rows(suffix, itemsize)
+        full = self._map("f32", "float32", self.dim)
+        for start in range(done, len(full), self.SCAN_BLOCK):
+            self._write_quantized(start, np.asarray(full[start:start + self.SCAN_BLOCK]))
+
+    # ---------------- search ----------------
+
+    def coarse_scores(self, q, n=None):
+        """
+        Approximate cosine similarity of `q` to the first `n` rows using
+        only the compressed codes.
+        """
+        n = len(self.codes) if n is None else min(n, len(self.codes))
+        out = np.empty(n, dtype="float32")
+        for s in range(0, n, self.SCAN_BLOCK):
+            e = min(n, s + self.SCAN_BLOCK)
+            block = self.codes[s:e].astype("float32")
+            out[s:e] = block @ q
+            if self.scales is not None:
+                out[s:e] *= self.scales[s:e]
+        return out
+
+    def search(self, q, k, active=None, rerank=100):
+        """
+        Coarse scan over compressed vectors, then exact cosine rerank of
+        the best `rerank` candidates from the float32 file.
+        Returns (labels, cosine distances) shaped like hnswlib's knn_query.
+        """
+        q = normalize(q).reshape(-1)
+        scores = self.coarse_scores(q)
+        if active is not None:
+            live = np.zeros(len(scores), dtype=bool)
+            live[:len(active)] = np.asarray(active[:len(scores)], dtype=bool)
+            scores[~live] = -np.inf
+
+        m = min(max(rerank, k), int(np.isfinite(scores).sum()))
+        if m == 0:
+            return np.empty((1, 0), dtype="uint64"), np.empty((1, 0), dtype="float32")
+
+        cand = np.sort(np.argpartition(-scores, m - 1)[:m])
+        exact = np.asarray(self.full[cand]) @ q
+        order = np.argsort(-exact)[:k]
+        return cand[order][None, :].astype("uint64"), (1.0 - exact[order])[None, :]
+
+    def resident_bytes(self):
+        if self.codes is None:
+            return 0
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)